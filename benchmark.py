@@ -0,0 +1,200 @@
+"""Benchmark de uma simulação completa do mercado, sem o Pade e o mosaik.
+
+Os componentes são executados no mesmo processo por um escalonador
+sintético com o mesmo passo de tempo do mosaik:
+
+- prosumer: prosumer.Simulator com a população de prosumidores, que
+  recebe a cada passo os mesmos comandos vazios enviados pelo mosaik;
+- exchange: montagem do vetor de potências dos nós a partir do
+  device_status de cada prosumidor, como em MyGrid.step;
+- grid: fluxo de carga com my_grid_simulator;
+- market: curvas de demanda de todos os prosumidores, codificadas como
+  em AuctionPropose e decodificadas, agregadas e liquidadas como em
+  AuctionClear, a cada uma hora simulada.
+
+Os prosumidores recebem os dispositivos dos nós de config.json de forma
+cíclica e são distribuídos pelos nós de carga da rede. Com --generate
+os alimentadores e suas populações são gerados por feeder_generator.
+Cada caso é executado em um processo próprio, de modo que o pico de
+memória (RSS) reportado é o do caso. O resultado é uma linha JSON por caso.
+
+======= Uso ================
+python benchmark.py --prosumers 10 100 1000 10000 --grid force.json
+python benchmark.py --engine objects --steps 96 --output bench.jsonl
+python benchmark.py --prosumers 1000 --generate 100 1000
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import my_grid_simulator
+from feeder_generator import generate_feeder, write_feeder
+from calc_methods import price_grid
+from curve_codec import decode_bid, encode_logistic
+from market import BidAggregator
+from prosumer import Simulator
+from scenario import load_scenario
+
+START = '25/01/2019 - 10:00:00'
+COMPONENTS = ('prosumer', 'exchange', 'grid', 'market')
+
+
+def prosumer_inputs(configs):
+    '''inputs do Simulator.step com um comando vazio para cada
+    dispositivo de cada prosumidor, na forma enviada pelo mosaik.
+    '''
+    return {'Prosumer_{}'.format(node): {
+                'commands': {'ProsumerAgent_{}'.format(node): {d: {} for d in config}}}
+            for node, config in configs.items()}
+
+
+def prosumer_configs(n, config_file='config.json', grid_file='force.json'):
+    '''config_dict do ProsumerSim com n prosumidores, com os dispositivos
+    dos nós de config.json repetidos de forma cíclica.
+    '''
+    base = list(load_scenario(grid_file, config_file, cache_dir=None).prosumer_configs().values())
+    base = [c for c in base if c] or [{'user_action_device': {'value': 1.0}}]
+    return {str(i): base[i % len(base)] for i in range(n)}
+
+
+def run_case(prosumers, grid_file, engine='fleet', steps=96, step_size=15 * 60,
+             auction_interval=60 * 60, points=501, seed=0, config_file='config.json'):
+    '''Executa um caso do benchmark e retorna o dicionário de resultados.
+
+    :param prosumers: quantidade de prosumidores
+    :param grid_file: arquivo da rede no formato de force.json
+    :param engine: motor do prosumer.Simulator ('objects' ou 'fleet')
+    :param steps: quantidade de passos de tempo simulados
+    :param step_size: passo de tempo em segundos
+    :param auction_interval: intervalo entre os leilões em segundos
+    :param points: pontos da grade de preços da busca do equilíbrio
+    :param seed: semente dos parâmetros das curvas de demanda
+    :param config_file: dispositivos dos prosumidores, no formato de config.json
+    '''
+    rng = np.random.RandomState(seed)
+    timers = dict.fromkeys(COMPONENTS, 0.0)
+
+    setup = time.perf_counter()
+    configs = prosumer_configs(prosumers, config_file, grid_file)
+    sim = Simulator(START, engine=engine, step_size=step_size)
+    sim.add_prosumers(configs)
+    inputs = prosumer_inputs(configs)
+    names = list(sim.prosumers)
+
+    with open(grid_file) as f:
+        grid = my_grid_simulator.load_mygrid_model(io.StringIO(f.read()), cache_dir=None)
+    index = my_grid_simulator.input_index(grid)
+    # prosumidor -> posição do seu nó de carga no vetor de potências
+    node_of = np.arange(prosumers) % len(index)
+    t = price_grid()
+    bids = BidAggregator(t, capacity=prosumers + 1)
+    setup = time.perf_counter() - setup
+
+    iterations = 0
+    auctions = 0
+    cleared = 0
+    start = time.perf_counter()
+    for k in range(steps):
+        now = k * step_size
+
+        t0 = time.perf_counter()
+        sim.step(now, inputs)
+        t1 = time.perf_counter()
+
+        demand = np.fromiter((sum(d['power'] for d in sim.prosumers[name].device_status.values())
+                              for name in names), dtype=float, count=prosumers)
+        powers = np.zeros(len(index))
+        np.add.at(powers, node_of, demand)
+        t2 = time.perf_counter()
+
+        my_grid_simulator.apply_inputs(grid, powers)
+        result = my_grid_simulator.run_power_flow(grid)
+        if k == 0 and not result['iterations'] > 1:
+            raise RuntimeError('The grid was solved without the prosumer loads')
+        iterations += result['iterations'] or 0
+        t3 = time.perf_counter()
+
+        if now % auction_interval == 0:
+            bids.reset()
+            params = np.column_stack([rng.uniform(0.5, 4.5, prosumers),
+                                      rng.uniform(-5.0, 5.0, prosumers),
+                                      rng.uniform(-5.0, 5.0, prosumers),
+                                      np.full(prosumers, 6.0)])
+            for i, row in enumerate(params):
+                content = encode_logistic(row[np.newaxis])
+                bids.add(i, *decode_bid(content))
+            result = bids.clear(points=points)
+            auctions += 1
+            cleared += result.cleared
+        t4 = time.perf_counter()
+
+        timers['prosumer'] += t1 - t0
+        timers['exchange'] += t2 - t1
+        timers['grid'] += t3 - t2
+        timers['market'] += t4 - t3
+    total = time.perf_counter() - start
+
+    return {'prosumers': prosumers,
+            'grid': os.path.basename(grid_file),
+            'grid_nodes': len(index),
+            'engine': engine,
+            'steps': steps,
+            'setup_s': setup,
+            'total_s': total,
+            'steps_per_s': steps / total if total else None,
+            'time_s': timers,
+            'power_flow_iterations': iterations,
+            'auctions': auctions,
+            'cleared': cleared,
+            # ru_maxrss é dado em kB no Linux
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--prosumers', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--grid', nargs='*', default=['force.json'],
+                        help='arquivos de rede no formato de force.json')
+    parser.add_argument('--generate', type=int, nargs='*', default=[], metavar='LV_NODES',
+                        help='alimentadores sintéticos com LV_NODES nós de baixa tensão')
+    parser.add_argument('--engine', default='fleet', choices=['objects', 'fleet'])
+    parser.add_argument('--steps', type=int, default=96)
+    parser.add_argument('--points', type=int, default=501)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None,
+                        help='arquivo JSON lines, acrescentado a cada execução')
+    args = parser.parse_args(argv)
+
+    out = open(args.output, 'a') if args.output else sys.stdout
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [(grid_file, 'config.json') for grid_file in args.grid]
+        for lv_nodes in args.generate:
+            grid_file = os.path.join(tmp, 'force_{}.json'.format(lv_nodes))
+            config_file = os.path.join(tmp, 'config_{}.json'.format(lv_nodes))
+            write_feeder(*generate_feeder(lv_nodes, seed=args.seed), grid_file, config_file)
+            cases.append((grid_file, config_file))
+
+        for grid_file, config_file in cases:
+            for prosumers in args.prosumers:
+                # um processo por caso, para que o pico de memória seja o do caso
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    result = pool.submit(run_case, prosumers, grid_file, args.engine,
+                                         args.steps, points=args.points, seed=args.seed,
+                                         config_file=config_file).result()
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+    if out is not sys.stdout:
+        out.close()
+
+
+if __name__ == '__main__':
+    main()
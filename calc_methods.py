@@ -1,4 +1,55 @@
-from numpy import linspace, exp
+from numpy import linspace, exp, asarray, broadcast_arrays
+
+# grades de preço já calculadas: (t0, t1, pontos) -> array somente leitura
+_grids = dict()
+
+
+def price_grid(t0=0.0, t1=5.0, points=50):
+    '''retorna a grade de preços compartilhada entre as curvas, calculada
+    uma única vez para cada faixa de preços. O array é somente leitura.
+    '''
+    key = (float(t0), float(t1), int(points))
+    t = _grids.get(key)
+    if t is None:
+        t = linspace(t0, t1, points)
+        t.flags.writeable = False
+        _grids[key] = t
+    return t
+
+
+def logistic_curves(t, tm, ymax, ymin, k=6.0):
+    '''avalia várias curvas logísticas na grade de preços t em uma única
+    operação. Os parâmetros podem ser escalares ou arrays com uma posição
+    por curva, o resultado é uma matriz (curvas x pontos de t).
+
+    parametros
+    ----------
+
+    t : grade de preços
+    tm : preço no ponto médio de cada curva
+    ymax : valor máximo de demanda de cada curva
+    ymin : valor mínimo de demanda de cada curva
+    k : inclinação de cada curva
+    '''
+    tm, ymax, ymin, k = broadcast_arrays(*[asarray(p, dtype=float).reshape(-1, 1)
+                                           for p in (tm, ymax, ymin, k)])
+    # ymax / (1 + e^(k(t - tm))) + ymin / (1 + e^(-k(t - tm))), as duas
+    # parcelas somam 1, o que permite calcular apenas uma exponencial
+    s = 1.0 / (1.0 + exp(k * (t - tm)))
+    return ymin + (ymax - ymin) * s
+
+
+def demand_curves(tm, ymax, ymin, k=6.0, t0=0.0, t1=5.0, points=50):
+    '''calcula os pontos de várias curvas de demanda, retornando a grade de
+    preços t e a matriz (curvas x pontos) com uma curva por linha
+
+    ======= Uso ================
+    t, y = demand_curves(tm=[1.0, 2.5], ymax=[3.0, -1.0], ymin=[1.0, -4.0])
+    y.sum(axis=0)   # curva agregada
+    '''
+    t = price_grid(t0, t1, points)
+    return t, logistic_curves(t, tm, ymax, ymin, k)
+
 
 def demand_curve(t0=0.0, t1=5.0, tm=None, ymax=1.0, ymin=0.0, k=6.0):
     '''calcula os pontos da curva de demanda
@@ -15,9 +66,8 @@ def demand_curve(t0=0.0, t1=5.0, tm=None, ymax=1.0, ymin=0.0, k=6.0):
     if not tm:
         tm = t0 + (t1 - t0) / 2.0 # ponto medio da curva
 
-    t = linspace(t0, t1, 50)
-    y = ymax * (1.0 / (1.0 + exp(k*(t - tm)))) + ymin * (1.0 / (1.0 + exp(-k*(t - tm))))
-    return t, y
+    t, y = demand_curves(tm, ymax, ymin, k, t0, t1)
+    return t, y[0]
 
 def utility_curve(t0=0.0, t1=5.0, min_price=(1.0, 0.0), max_power=(5.0, 50.0)):
     '''calcula os pontos da curva de demanda
@@ -34,7 +84,7 @@ def utility_curve(t0=0.0, t1=5.0, min_price=(1.0, 0.0), max_power=(5.0, 50.0)):
 
 
 
-    t = linspace(t0, t1, 50)
+    t = price_grid(t0, t1)
     a = min_price[1] - max_power[1]
     b = min_price[0] - max_power[0]
     c = min_price[0] * max_power[1] - min_price[1] - max_power[0]
@@ -15,8 +15,12 @@ from pade.misc.utility import call_later
 
 from twisted.internet import defer
 
-from start_mosaik_sim import load_low_voltage_prosumers
-import pickle
+from scenario import load_scenario
+from flow_control import StepWindow
+from curve_codec import decode_bid, CurveDecodeError
+from market import BidAggregator
+import instrumentation
+from instrumentation import timed
 import numpy as np
 
 from time import sleep
@@ -46,6 +50,9 @@ class MosaikSim(MosaikCon):
         self.eid_prefix = eid_prefix
         self.start = start
         self.step_size = step_size
+        # o step que lança o leilão só é concluído quando
+        # todas as propostas forem analisadas
+        self.window = StepWindow(self, size=1, name='ConcentratorAgent')
         return MOSAIK_MODELS
 
 
@@ -57,6 +64,7 @@ class MosaikSim(MosaikCon):
         return entities_info
 
     def step(self, time, inputs):
+        self.window.step_started()
 
         # Inicia o mercado após período de aquisição de dados de uma semana 
         # com negociações a cada uma hora.
@@ -68,8 +76,9 @@ class MosaikSim(MosaikCon):
             for participant in self.agent.participants:
                 message.add_receiver(AID(name=participant))
 
+            self.window.begin('auction')
             self.agent.call_later(0.1, self.launch_contract_net_protocol, message)
-            return
+            return self.window.step_finished(time)
             # self.launch_contract_net_protocol(message)
             # d = defer.Deferred()
             # d.addCallback(self.next_step)
@@ -77,7 +86,7 @@ class MosaikSim(MosaikCon):
 
             # return d
 
-        return time + self.step_size
+        return self.window.step_finished(time)
 
 
     def next_step(self, time):
@@ -104,6 +113,10 @@ class MosaikSim(MosaikCon):
                 data[eid][attr] = getattr(self.agent, 'clear_price')
         return data
 
+    def stop(self):
+        display_message(self.agent.aid.localname, str(self.window.latency))
+        instrumentation.export()
+
 class AuctionClear(FipaContractNetProtocol):
     '''AuctionClear
 
@@ -116,7 +129,15 @@ class AuctionClear(FipaContractNetProtocol):
         super(AuctionClear, self).__init__(
             agent=agent, message=message, is_initiator=True)
         self.cfp = message
+        # as propostas são somadas em handle_propose, à medida que chegam
+        self.t = np.linspace(0.0, 5.0, 50)
+        self.bids = BidAggregator(self.t)
 
+    def on_start(self):
+        self.bids.reset()
+        super(AuctionClear, self).on_start()
+
+    @timed('AuctionClear.handle_all_proposes')
     def handle_all_proposes(self, proposes):
         """
         """
@@ -125,31 +146,20 @@ class AuctionClear(FipaContractNetProtocol):
 
         display_message(self.agent.aid.name, 'Analyzing proposals...')
 
-        self.t = np.linspace(0.0, 5.0, 50)
-        self.y = np.zeros(50)
-        accepted_proposes_aids = list()
-        not_accepted_proposes_aids = list()
-        # logic to select proposals by the higher available power.
-        # In the propose analysis some others restrictions need to be
-        # verified, like the price interval that needs to be in conformance.   
-        for message in proposes:
-            display_message(self.agent.aid.name,'PROPOSE message from {}'.format(message.sender.name))
-
-            t, y = pickle.loads(message.content)
-            if self.t.all() == t.all():
-                self.y += y
-                accepted_proposes_aids.append(message.sender.name)
-            else:
-                not_accepted_proposes_aids.append(message.sender.name)
-
-        # finfding the clear price
-        try:
-            index_ = np.where(self.y[:-1] * self.y[1:] < 0.0)[0][0]
-            self.agent.clear_price = float((self.t[index_] + self.t[index_ + 1]) / 2.0)
+        accepted_proposes_aids = self.bids.accepted
+        not_accepted_proposes_aids = self.bids.rejected
+
+        # finding the clear price
+        result = self.bids.clear(points=self.agent.price_points)
+        if result.cleared:
+            self.agent.clear_price = result.price
+            self.agent.cleared_quantities = dict(zip(accepted_proposes_aids,
+                                                     result.quantities.tolist()))
             display_message(self.agent.aid.name, 'The clear price is U${:05.2f}'.format(self.agent.clear_price))
-        except Exception as e:
+        else:
             display_message(self.agent.aid.name, 'No match for clear price!')
             self.agent.clear_price = 0.0
+            self.agent.cleared_quantities = dict()
 
         if not_accepted_proposes_aids:
             display_message(self.agent.aid.name, 'Sending REJECT_PROPOSAL answers...')
@@ -171,7 +181,7 @@ class AuctionClear(FipaContractNetProtocol):
 
         self.agent.auction_finished = True
 
-        self.agent.mosaik_sim.step_done()
+        self.agent.mosaik_sim.window.end('auction')
 
     def handle_inform(self, message):
         """
@@ -194,6 +204,18 @@ class AuctionClear(FipaContractNetProtocol):
 
         display_message(self.agent.aid.name, 'PROPOSE message received')
 
+        # logic to select proposals by the higher available power.
+        # In the propose analysis some others restrictions need to be
+        # verified, like the price interval that needs to be in conformance.
+        try:
+            t, y, params = decode_bid(message.content)
+        except CurveDecodeError as e:
+            display_message(self.agent.aid.name, 'Invalid PROPOSE from {}: {}'.format(message.sender.name, e))
+            self.bids.rejected.append(message.sender.name)
+            return
+        # somente curvas na mesma grade de preços podem ser somadas
+        self.bids.add(message.sender.name, t, y, params)
+
 
 class ReceiveInformFromProsumerAgent(FipaRequestProtocol):
     """Comportamento FIPA Request
@@ -214,8 +236,12 @@ class ConcentratorAgent(Agent):
 
         self.clear_price = None
         self.auction_finished = False
+        # pontos da grade de preços utilizada na busca do preço de
+        # equilíbrio e quantidade liquidada de cada participante
+        self.price_points = 501
+        self.cleared_quantities = dict()
         # carrega os nomes dos agentes participantes do leilão
-        prosumers_id = load_low_voltage_prosumers('force.json')
+        prosumers_id = load_scenario('force.json', 'config.json').prosumers
         self.participants = list() 
         for p_id in prosumers_id:
             name = 'device' + str(p_id)
@@ -0,0 +1,191 @@
+"""Formato binário das curvas preço x demanda trocadas no leilão.
+
+As propostas (PROPOSE) enviadas ao ConcentratorAgent carregavam a tupla
+(t, y) serializada com pickle, repetindo em cada mensagem a mesma grade
+de preços t. Aqui a grade de preços é compartilhada pelos agentes e
+identificada por um número, e apenas os valores de y são enviados.
+
+Estrutura da mensagem (little-endian):
+
+    magic   2 bytes   b'CV'
+    version 1 byte    VERSION
+    grid    1 byte    id da grade de preços em PRICE_GRIDS, 0 se a
+                      grade é enviada junto com a curva
+    dtype   1 byte    4 (float32) ou 8 (float64)
+    points  2 bytes   quantidade de pontos da curva
+    [t]     points x dtype, somente quando grid == 0
+    y       points x dtype
+
+Curvas formadas por uma soma de logísticas (calc_methods.demand_curves)
+podem ser enviadas apenas pelos seus parâmetros, quatro valores por
+logística ao invés dos pontos da curva:
+
+    magic   2 bytes   b'CL'
+    version 1 byte    VERSION
+    grid    1 byte    id da grade de preços em PRICE_GRIDS
+    count   2 bytes   quantidade de logísticas
+    params  count x 4 x float64: tm, ymax, ymin, k
+
+decode_curve avalia a soma das logísticas na grade de preços, de modo que
+quem recebe a proposta não precisa distinguir os dois formatos;
+decode_bid também retorna os parâmetros, para que a curva possa ser
+avaliada exatamente fora da grade (market.BidAggregator).
+
+======= Uso ================
+content = encode_curve(t, y)
+t, y = decode_curve(content)
+
+content = encode_logistic([(tm, ymax, ymin, k), ...])
+t, y = decode_curve(content)
+t, y, params = decode_bid(content)
+"""
+
+import struct
+
+import numpy as np
+
+from calc_methods import logistic_curves
+
+MAGIC = b'CV'
+VERSION = 1
+HEADER = struct.Struct('<2sBBBH')
+
+LOGISTIC_MAGIC = b'CL'
+LOGISTIC_HEADER = struct.Struct('<2sBBH')
+
+# grades de preço compartilhadas: id -> (preço mínimo, preço máximo, pontos)
+PRICE_GRIDS = {1: (0.0, 5.0, 50)}
+
+_grids = dict()
+_dtypes = {4: np.dtype('<f4'), 8: np.dtype('<f8')}
+
+
+class CurveDecodeError(ValueError):
+    pass
+
+
+def price_grid(grid_id):
+    '''Grade de preços compartilhada, somente leitura.'''
+    t = _grids.get(grid_id)
+    if t is None:
+        t0, t1, points = PRICE_GRIDS[grid_id]
+        t = np.linspace(t0, t1, points)
+        t.flags.writeable = False
+        _grids[grid_id] = t
+    return t
+
+
+def _find_grid(t):
+    for grid_id, (t0, t1, points) in PRICE_GRIDS.items():
+        if len(t) == points and np.array_equal(t, price_grid(grid_id)):
+            return grid_id
+    return 0
+
+
+def encode_curve(t, y, dtype=np.float64):
+    '''Codifica a curva (t, y). Se t for uma das grades compartilhadas
+    somente y é enviado, caso contrário t segue junto com a curva.
+
+    :param dtype: np.float64 ou np.float32 para reduzir a mensagem
+    '''
+    dtype = np.dtype(dtype).newbyteorder('<')
+    if dtype.itemsize not in _dtypes:
+        raise ValueError('Unsupported curve dtype: {}'.format(dtype))
+    t = np.asarray(t)
+    y = np.asarray(y)
+    if t.shape != y.shape or t.ndim != 1:
+        raise ValueError('Curve t and y must be 1-d arrays of the same size')
+
+    grid_id = _find_grid(t)
+    header = HEADER.pack(MAGIC, VERSION, grid_id, dtype.itemsize, len(y))
+    if grid_id:
+        return header + y.astype(dtype).tobytes()
+    return header + t.astype(dtype).tobytes() + y.astype(dtype).tobytes()
+
+
+def encode_logistic(params, grid_id=1):
+    '''Codifica uma curva formada pela soma de logísticas através dos
+    seus parâmetros.
+
+    :param params: sequência de (tm, ymax, ymin, k), uma por logística
+    :param grid_id: id da grade de preços em PRICE_GRIDS em que a curva
+    será avaliada por quem a recebe
+    '''
+    if grid_id not in PRICE_GRIDS:
+        raise ValueError('Unknown price grid: {}'.format(grid_id))
+    params = np.asarray(params, dtype='<f8')
+    if params.ndim != 2 or params.shape[1] != 4:
+        raise ValueError('Logistic params must be a (n x 4) array')
+    header = LOGISTIC_HEADER.pack(LOGISTIC_MAGIC, VERSION, grid_id, len(params))
+    return header + params.tobytes()
+
+
+def decode_logistic(data):
+    '''Decodifica os parâmetros gerados por encode_logistic, retornando
+    (grid_id, params) com params (n x 4).
+    '''
+    if len(data) < LOGISTIC_HEADER.size:
+        raise CurveDecodeError('Curve content too short')
+    magic, version, grid_id, count = LOGISTIC_HEADER.unpack_from(data)
+    if magic != LOGISTIC_MAGIC:
+        raise CurveDecodeError('Not a logistic curve message')
+    if version != VERSION:
+        raise CurveDecodeError('Unsupported curve version: {}'.format(version))
+    if grid_id not in PRICE_GRIDS:
+        raise CurveDecodeError('Unknown price grid: {}'.format(grid_id))
+    expected = LOGISTIC_HEADER.size + count * 4 * 8
+    if len(data) != expected:
+        raise CurveDecodeError('Curve content has {} bytes, expected {}'.format(len(data), expected))
+    params = np.frombuffer(data, dtype='<f8', count=count * 4,
+                           offset=LOGISTIC_HEADER.size).reshape(count, 4)
+    return grid_id, params
+
+
+def decode_bid(data):
+    '''Como decode_curve, mas retorna (t, y, params), com params (n x 4)
+    quando a curva foi gerada por encode_logistic e None caso contrário.
+    '''
+    if isinstance(data, str):
+        raise CurveDecodeError('Curve content must be bytes')
+    if data[:2] == LOGISTIC_MAGIC:
+        grid_id, params = decode_logistic(data)
+        t = price_grid(grid_id)
+        return t, logistic_curves(t, *params.T).sum(axis=0), params
+    t, y = decode_curve(data)
+    return t, y, None
+
+
+def decode_curve(data):
+    '''Decodifica uma curva gerada por encode_curve ou encode_logistic,
+    retornando (t, y). Quando a grade é compartilhada t é o array da
+    grade, somente leitura.
+    '''
+    if isinstance(data, str):
+        raise CurveDecodeError('Curve content must be bytes')
+    if data[:2] == LOGISTIC_MAGIC:
+        t, y, _ = decode_bid(data)
+        return t, y
+    if len(data) < HEADER.size:
+        raise CurveDecodeError('Curve content too short')
+    magic, version, grid_id, itemsize, points = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise CurveDecodeError('Not a curve message')
+    if version != VERSION:
+        raise CurveDecodeError('Unsupported curve version: {}'.format(version))
+    if itemsize not in _dtypes:
+        raise CurveDecodeError('Unsupported curve dtype size: {}'.format(itemsize))
+    dtype = _dtypes[itemsize]
+
+    expected = HEADER.size + points * itemsize * (1 if grid_id else 2)
+    if len(data) != expected:
+        raise CurveDecodeError('Curve content has {} bytes, expected {}'.format(len(data), expected))
+
+    if grid_id:
+        if grid_id not in PRICE_GRIDS or PRICE_GRIDS[grid_id][2] != points:
+            raise CurveDecodeError('Unknown price grid: {}'.format(grid_id))
+        t = price_grid(grid_id)
+        y = np.frombuffer(data, dtype=dtype, count=points, offset=HEADER.size)
+    else:
+        t = np.frombuffer(data, dtype=dtype, count=points, offset=HEADER.size).astype(np.float64)
+        y = np.frombuffer(data, dtype=dtype, count=points, offset=HEADER.size + points * itemsize)
+    return t, y.astype(np.float64)
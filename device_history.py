@@ -0,0 +1,173 @@
+"""Histórico das potências dos dispositivos de um ProsumerAgent.
+
+As potências de todos os dispositivos ficam em um único array
+pré-alocado (dispositivos x passos de tempo). No modo ring buffer
+apenas os últimos `capacity` passos são mantidos em memória, de modo
+que a memória usada por agente não cresce com a duração da simulação.
+Cada valor é escrito duas vezes (posições i e i + capacity), assim
+qualquer janela dos passos mais recentes é uma fatia contígua do array
+e window() retorna uma view, sem cópia.
+
+Os passos ainda não gravados são acrescentados em disco por flush() em
+blocos .npz, sem reescrever o que já foi gravado. O índice de tempo não
+é materializado: o passo k corresponde a start + step x k segundos.
+
+======= Uso ================
+history = DeviceHistory(capacity=7 * 96, ring=True,
+                        path='data/ProsumerSim0-0.Prosumer_4',
+                        start='25/01/2019 - 10:00:00', step=15 * 60)
+history.append_status(device_status_)
+history.window(96)              # último dia, (dispositivos x 96)
+history['shiftable_load']       # passos em memória de um dispositivo
+history.flush()
+
+data = DeviceHistory.load('data/ProsumerSim0-0.Prosumer_4')
+DeviceHistory.to_json('data/ProsumerSim0-0.Prosumer_4', 'prosumer_4.json')
+"""
+
+import datetime as dt
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+
+DEVICES = ('stochastic_gen',
+           'freely_control_gen',
+           'shiftable_load',
+           'buffering_device',
+           'user_action_device',
+           'storage_device')
+
+
+class DeviceHistory(object):
+    '''Histórico (dispositivos x passos) das potências dos dispositivos.
+
+    :param devices: nomes dos dispositivos, um por linha do array
+    :param capacity: quantidade de passos em memória; fora do modo ring
+    buffer é apenas a capacidade inicial, que dobra quando necessário
+    :param ring: mantém somente os últimos `capacity` passos
+    :param path: diretório onde os blocos são gravados, None desativa
+    a gravação
+    :param start: instante do passo 0, no formato dd/mm/YYYY - hh:mm:ss
+    :param step: intervalo entre os passos em segundos
+    '''
+    def __init__(self, devices=DEVICES, capacity=7 * 96, ring=False,
+                 path=None, start=None, step=15 * 60):
+        self.devices = list(devices)
+        self.index = {d: i for i, d in enumerate(self.devices)}
+        self.capacity = capacity
+        self.ring = ring
+        self.path = path
+        self.start = start
+        self.step = step
+
+        width = 2 * capacity if ring else capacity
+        self.data = np.zeros((len(self.devices), width))
+        self.steps = 0
+        self.flushed = 0
+        self.chunks = 0
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            for f in glob.glob(os.path.join(path, 'chunk_*.npz')):
+                os.remove(f)
+            json.dump({'devices': self.devices, 'start': start, 'step': step},
+                      open(os.path.join(path, 'meta.json'), 'w'))
+
+    def __len__(self):
+        '''quantidade de passos disponíveis em memória'''
+        return min(self.steps, self.capacity) if self.ring else self.steps
+
+    def append(self, values):
+        '''Registra as potências de um passo, na ordem de self.devices.'''
+        if self.ring:
+            if self.path is not None and self.steps - self.flushed == self.capacity:
+                # o passo mais antigo ainda não gravado seria sobrescrito
+                self.flush()
+            i = self.steps % self.capacity
+            self.data[:, i] = values
+            self.data[:, i + self.capacity] = values
+        else:
+            if self.steps == self.data.shape[1]:
+                grown = np.zeros((len(self.devices), 2 * self.data.shape[1]))
+                grown[:, :self.steps] = self.data
+                self.data = grown
+            self.data[:, self.steps] = values
+        self.steps += 1
+
+    def append_status(self, device_status):
+        '''Registra um passo a partir do device_status enviado pelo
+        ProsumerSim; dispositivos ausentes têm potência 0.0.
+        '''
+        self.append([(device_status.get(d) or {}).get('power', 0.0)
+                     for d in self.devices])
+
+    def window(self, size=None):
+        '''View (dispositivos x size) dos últimos size passos, do mais
+        antigo para o mais recente. size=None retorna todos os passos
+        disponíveis em memória.
+        '''
+        size = len(self) if size is None else min(size, len(self))
+        if self.ring:
+            end = (self.steps - 1) % self.capacity + self.capacity + 1 if self.steps else 0
+        else:
+            end = self.steps
+        return self.data[:, end - size:end]
+
+    def __getitem__(self, device):
+        return self.window()[self.index[device]]
+
+    def flush(self):
+        '''Acrescenta em disco os passos registrados desde o último flush.'''
+        if self.path is None or self.flushed == self.steps:
+            return
+        new = self.window(self.steps - self.flushed)
+        np.savez(os.path.join(self.path, 'chunk_{:05d}.npz'.format(self.chunks)),
+                 first=self.flushed, values=new)
+        self.chunks += 1
+        self.flushed = self.steps
+
+    def close(self):
+        self.flush()
+
+    @staticmethod
+    def load(path):
+        '''Lê todos os blocos gravados em path e retorna um dicionário
+        dispositivo -> array com as potências de todos os passos, com as
+        chaves start e step para o índice de tempo.
+        '''
+        meta = json.load(open(os.path.join(path, 'meta.json')))
+        chunks = [np.load(f) for f in sorted(glob.glob(os.path.join(path, 'chunk_*.npz')))]
+        if chunks:
+            values = np.concatenate([c['values'] for c in chunks], axis=1)
+        else:
+            values = np.zeros((len(meta['devices']), 0))
+        data = {'start': meta['start'], 'step': meta['step']}
+        for i, device in enumerate(meta['devices']):
+            data[device] = values[i]
+        return data
+
+    @staticmethod
+    def timestamps(data):
+        '''Instantes de cada passo, start + step x k.'''
+        start = dt.datetime.strptime(data['start'], '%d/%m/%Y - %H:%M:%S')
+        steps = len(next(v for k, v in data.items() if k not in ('start', 'step')))
+        return np.datetime64(start) + np.arange(steps) * np.timedelta64(data['step'], 's')
+
+    @staticmethod
+    def to_json(path, file):
+        '''Exporta o histórico gravado em path para um arquivo JSON no
+        formato {dispositivo: {timestamp em ms: potência}}.
+        '''
+        data = DeviceHistory.load(path)
+        times = DeviceHistory.timestamps(data).astype('datetime64[ms]').astype(np.int64)
+        out = {d: dict(zip(map(str, times.tolist()), v.tolist()))
+               for d, v in data.items() if d not in ('start', 'step')}
+        json.dump(out, open(file, 'w'))
+
+
+if __name__ == '__main__':
+    # ex.: python device_history.py data/ProsumerSim0-0.Prosumer_4 prosumer_4.json
+    DeviceHistory.to_json(sys.argv[1], sys.argv[2])
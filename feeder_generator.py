@@ -0,0 +1,224 @@
+"""Gerador de alimentadores radiais sintéticos e de suas populações de
+dispositivos, nos formatos de force.json e config.json.
+
+O alimentador é formado por um tronco de média tensão, iniciado no nó 0
+(rede externa) e com a chave sw_1 na primeira seção, do qual partem os
+transformadores. Cada transformador alimenta uma rede de baixa tensão em
+árvore, em que cada novo nó é ligado a um dos nós já existentes da mesma
+rede e recebe uma fase (a, b ou c) de forma balanceada. Os nós são
+numerados em sequência, com name == id == posição na lista, como espera
+my_grid_simulator.create_mygrid_model.
+
+Cada nó de baixa tensão recebe um dispositivo de cada tipo com
+probabilidade pu_consumers, e a potência do dispositivo é sorteada na
+faixa informada para o tipo. O resultado depende apenas dos parâmetros
+e da semente.
+
+======= Uso ================
+grid, config = generate_feeder(lv_nodes=1000, seed=1)
+write_feeder(grid, config, 'force_1000.json', 'config_1000.json')
+
+python feeder_generator.py 1000 --seed 1 --grid force_1000.json --config config_1000.json
+"""
+
+import argparse
+import json
+import math
+
+import numpy as np
+
+# tipo do dispositivo -> pu_load, pu_consumers e faixa de potência (kW),
+# próximos aos valores de config.json
+DEVICE_TYPES = {'stochastic_gen': {'pu_load': 0.3, 'pu_consumers': 0.4, 'power': (0.2, 6.0)},
+                'shiftable_load': {'pu_load': 0.2, 'pu_consumers': 1.0, 'power': (0.0, 2.1)},
+                'buffering_device': {'pu_load': 0.3, 'pu_consumers': 0.8, 'power': (0.1, 3.0)},
+                'storage_device': {'pu_load': 0.3, 'pu_consumers': 0.2, 'power': (3.0, 10.0)},
+                'freely_control_gen': {'pu_load': 0.2, 'pu_consumers': 0.05, 'power': (20.0, 20.0)},
+                'user_action_device': {'pu_load': 0.5, 'pu_consumers': 1.0, 'power': (0.0, 5.6)}}
+
+TRANSFORMER_POWERS = (45.0, 75.0, 112.5, 150.0)
+MV_COLOR = 'rgb(31, 119, 180)'
+LV_COLOR = 'rgb(255, 127, 14)'
+
+
+def _node(i, level, power=0.0, phase=None):
+    node = {'name': i,
+            'voltage_level': level,
+            'color': MV_COLOR if level == 'medium voltage' else LV_COLOR,
+            'active_power': power,
+            'reactive_power': power}
+    if phase is not None:
+        node['phase'] = phase
+    node['id'] = i
+    return node
+
+
+def _link(source, target, kind, length=None, switch=None):
+    link = {'name': 'Section_{}_{}'.format(source, target), 'type': kind}
+    if length is not None:
+        link['length'] = length
+    link['switch'] = switch
+    link['source'] = source
+    link['target'] = target
+    return link
+
+
+def generate_feeder(lv_nodes, seed=None, lv_per_transformer=10, phases='abc',
+                    mv_length=(0.06, 0.1), lv_length=(0.006, 0.01),
+                    node_power=(0.7, 1.35), max_demand_kva=100.0, devices=None):
+    '''Gera um alimentador radial e a população de dispositivos,
+    retornando (grid, config) nos formatos de force.json e config.json.
+
+    :param lv_nodes: quantidade de nós de baixa tensão (prosumidores)
+    :param seed: semente do gerador de números aleatórios
+    :param lv_per_transformer: quantidade máxima de nós de baixa tensão
+    por transformador
+    :param phases: fases sorteadas para os nós de baixa tensão, 'abc'
+    para monofásicos balanceados entre as fases
+    :param mv_length: faixa do comprimento das seções de média tensão (km)
+    :param lv_length: faixa do comprimento das seções de baixa tensão (km)
+    :param node_power: faixa da potência inicial dos nós de baixa tensão
+    :param max_demand_kva: valor de max_demand_kva em config.json
+    :param devices: dicionário no formato de DEVICE_TYPES, os tipos
+    informados substituem os valores padrão
+    '''
+    if lv_nodes < 1:
+        raise ValueError('lv_nodes must be at least 1')
+    rng = np.random.RandomState(seed)
+    device_types = dict(DEVICE_TYPES)
+    device_types.update(devices or {})
+
+    transformers = int(math.ceil(lv_nodes / float(lv_per_transformer)))
+    # tronco de média tensão: nó 0 (rede externa), nó 1 após a chave e
+    # um nó por transformador
+    mv_nodes = transformers + 2
+
+    nodes = [_node(i, 'medium voltage') for i in range(mv_nodes)]
+    links = list()
+    for i in range(1, mv_nodes):
+        links.append(_link(i - 1, i, 'line',
+                           length=round(rng.uniform(*mv_length), 3),
+                           switch='sw_1' if i == 1 else None))
+
+    trafos = list()
+    sizes = np.array_split(np.arange(lv_nodes), transformers)
+    for k, size in enumerate(len(s) for s in sizes):
+        mv = k + 2
+        first = len(nodes)
+        # fases em blocos de três sorteadas sem reposição, de modo que as
+        # cargas de cada transformador fiquem balanceadas entre as fases
+        order = np.concatenate([rng.permutation(list(phases))
+                                for _ in range(int(math.ceil(size / float(len(phases)))))])
+        for j in range(size):
+            i = first + j
+            nodes.append(_node(i, 'low voltage',
+                               power=round(rng.uniform(*node_power), 3),
+                               phase=str(order[j])))
+            if j == 0:
+                links.append(_link(mv, i, 'transformer'))
+                trafos.append({'name': 'trafo_{}_{}'.format(mv, i),
+                               'source': mv,
+                               'target': i,
+                               'power': float(rng.choice(TRANSFORMER_POWERS))})
+            else:
+                # a ligação a um dos nós mais recentes forma ramais longos,
+                # como os de uma rede de baixa tensão
+                parent = first + rng.randint(max(0, j - 3), j)
+                links.append(_link(parent, i, 'line',
+                                   length=round(rng.uniform(*lv_length), 3)))
+
+    links.sort(key=lambda link: (link['source'], link['target']))
+    grid = {'directed': False,
+            'multigraph': False,
+            'graph': {},
+            'nodes': nodes,
+            'links': links,
+            'transformes': trafos}
+
+    lv = [n['name'] for n in nodes if n['voltage_level'] == 'low voltage']
+    config_devices = dict()
+    for device_type, info in device_types.items():
+        has_device = rng.uniform(size=len(lv)) < info['pu_consumers']
+        powers = np.round(rng.uniform(info['power'][0], info['power'][1], size=len(lv)), 2)
+        config_devices[device_type] = {
+            'pu_load': info['pu_load'],
+            'pu_consumers': info['pu_consumers'],
+            'powers': {str(n): float(p) for n, p, d in zip(lv, powers, has_device) if d}}
+
+    config = {'qtd_nodes_mv': mv_nodes,
+              'max_demand_kva': max_demand_kva,
+              'devices': config_devices,
+              'nodes': lv}
+    validate_feeder(grid)
+    return grid, config
+
+
+def validate_feeder(grid):
+    '''Verifica se o alimentador é radial e está no formato esperado por
+    create_mygrid_model; levanta ValueError caso contrário.
+    '''
+    nodes = grid['nodes']
+    for i, node in enumerate(nodes):
+        if node['name'] != i or node['id'] != i:
+            raise ValueError('Node {} is out of order'.format(node['name']))
+        if node['voltage_level'] == 'low voltage' and node.get('phase') not in ('a', 'b', 'c', 'abc'):
+            raise ValueError('Low voltage node {} has no phase'.format(i))
+    if nodes[0]['voltage_level'] != 'medium voltage':
+        raise ValueError('Node 0 must be the medium voltage source')
+    if len(grid['links']) != len(nodes) - 1:
+        raise ValueError('A radial feeder with {} nodes has {} links, found {}'.format(
+            len(nodes), len(nodes) - 1, len(grid['links'])))
+
+    neighbors = {i: list() for i in range(len(nodes))}
+    for link in grid['links']:
+        s, t = link['source'], link['target']
+        levels = (nodes[s]['voltage_level'], nodes[t]['voltage_level'])
+        if link['type'] == 'transformer' and levels != ('medium voltage', 'low voltage'):
+            raise ValueError('{} must connect medium to low voltage'.format(link['name']))
+        if link['type'] == 'line' and levels[0] != levels[1]:
+            raise ValueError('{} connects different voltage levels'.format(link['name']))
+        neighbors[s].append(t)
+        neighbors[t].append(s)
+
+    seen = {0}
+    stack = [0]
+    while stack:
+        for j in neighbors[stack.pop()]:
+            if j not in seen:
+                seen.add(j)
+                stack.append(j)
+    if len(seen) != len(nodes):
+        raise ValueError('{} nodes are not connected to node 0'.format(len(nodes) - len(seen)))
+
+
+def write_feeder(grid, config, grid_file='force.json', config_file='config.json'):
+    json.dump(grid, open(grid_file, 'w'))
+    json.dump(config, open(config_file, 'w'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('lv_nodes', type=int, help='quantidade de nós de baixa tensão')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--lv-per-transformer', type=int, default=10)
+    parser.add_argument('--pu-consumers', nargs='*', default=[], metavar='DEVICE=VALUE',
+                        help='penetração de um tipo de dispositivo, ex.: storage_device=0.5')
+    parser.add_argument('--grid', default='force_{lv_nodes}.json')
+    parser.add_argument('--config', default='config_{lv_nodes}.json')
+    args = parser.parse_args(argv)
+
+    devices = dict()
+    for item in args.pu_consumers:
+        device_type, value = item.split('=')
+        devices[device_type] = dict(DEVICE_TYPES[device_type], pu_consumers=float(value))
+
+    grid, config = generate_feeder(args.lv_nodes, seed=args.seed,
+                                   lv_per_transformer=args.lv_per_transformer,
+                                   devices=devices)
+    write_feeder(grid, config,
+                 args.grid.format(lv_nodes=args.lv_nodes),
+                 args.config.format(lv_nodes=args.lv_nodes))
+
+
+if __name__ == '__main__':
+    main()
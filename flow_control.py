@@ -0,0 +1,153 @@
+"""Controle de fluxo entre os simuladores do mosaik e os agentes do Pade.
+
+Os simuladores eram limitados por chamadas fixas a sleep(), para que os
+comportamentos do Pade acompanhassem o mosaik. Aqui os próprios agentes
+mantêm o step do seu simulador mosaik enquanto ainda houver conversas
+demais em andamento, de modo que a simulação avança tão rápido quanto o
+trabalho realizado permite.
+
+Um step mantido é liberado após um tempo máximo, mesmo que alguma
+conversa não tenha terminado (uma mensagem perdida ou um CFP sem
+resposta), para que a co-simulação não fique parada indefinidamente.
+"""
+
+import time
+
+import instrumentation
+
+
+class StepLatency(object):
+    '''Mede o tempo de relógio gasto em cada step de um simulador, do
+    pedido do step até a resposta ao mosaik. Cada medida também é
+    registrada no histograma (family, name) de instrumentation.
+
+    :param name: nome do simulador
+    :param family: família do histograma em instrumentation
+    '''
+    def __init__(self, name, family='step'):
+        self.name = name
+        self.histogram = instrumentation.histogram(family, name)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.timeouts = 0
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+
+    def stop(self):
+        if self._start is None:
+            return
+        elapsed = time.perf_counter() - self._start
+        self._start = None
+        self.record(elapsed)
+
+    def record(self, elapsed):
+        '''Acrescenta uma medida feita externamente, em segundos.'''
+        self.histogram.observe(elapsed)
+        self.last = elapsed
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self):
+        return {'name': self.name,
+                'steps': self.count,
+                'timeouts': self.timeouts,
+                'total_s': self.total,
+                'mean_ms': self.mean * 1e3,
+                'max_ms': self.max * 1e3}
+
+    def __str__(self):
+        return '{}: {} steps ({} timeouts), mean {:.2f} ms, max {:.2f} ms, total {:.2f} s'.format(
+            self.name, self.count, self.timeouts, self.mean * 1e3, self.max * 1e3, self.total)
+
+
+class StepWindow(object):
+    '''Janela limitada de conversas em andamento de um agente do Pade.
+
+    O MosaikCon do agente chama begin() quando inicia uma conversa que
+    deve terminar antes que a simulação avance (um leilão, um pedido de
+    compra à concessionária...) e end() quando ela termina. Ao final do
+    seu step retorna step_finished(time): enquanto houver `size` ou mais
+    conversas em andamento o step é mantido (None é retornado ao mosaik)
+    e é liberado por step_done() assim que a janela tiver espaço.
+
+    Se a janela não tiver espaço após `timeout` segundos, as conversas
+    pendentes são informadas e descartadas, o tempo máximo é contado em
+    latency.timeouts e o step é liberado.
+
+    :param mosaik_sim: MosaikCon do agente
+    :param size: quantidade de conversas em andamento que mantém o step
+    :param name: nome utilizado nas medidas de latência
+    :param timeout: tempo máximo em segundos que um step é mantido,
+    None aguarda indefinidamente
+
+    ======= Uso ================
+    def step(self, time, inputs):
+        self.window.step_started()
+        ...
+        self.window.begin('auction')
+        ...
+        return self.window.step_finished(time)
+
+    def handle_accept_propose(self, message):
+        ...
+        self.agent.mosaik_sim.window.end('auction')
+    '''
+    def __init__(self, mosaik_sim, size=1, name=None, timeout=120.0):
+        self.mosaik_sim = mosaik_sim
+        self.size = size
+        self.timeout = timeout
+        self.in_flight = set()
+        self.held = False
+        self.deadline = None
+        self.latency = StepLatency(name or type(mosaik_sim).__name__)
+
+    def begin(self, key):
+        self.in_flight.add(key)
+
+    def end(self, key):
+        self.in_flight.discard(key)
+        if self.held and len(self.in_flight) < self.size:
+            self._release()
+
+    def step_started(self):
+        self.latency.start()
+
+    def step_finished(self, time):
+        if len(self.in_flight) >= self.size:
+            self.held = True
+            if self.timeout is not None:
+                from twisted.internet import reactor
+                self.deadline = reactor.callLater(self.timeout, self._expired)
+            return None
+        self.latency.stop()
+        return time + self.mosaik_sim.step_size
+
+    def _release(self):
+        self.held = False
+        if self.deadline is not None and self.deadline.active():
+            self.deadline.cancel()
+        self.deadline = None
+        self.latency.stop()
+        self.mosaik_sim.step_done()
+
+    def _expired(self):
+        self.deadline = None
+        if not self.held:
+            return
+        # as conversas pendentes são consideradas perdidas, caso
+        # contrário os próximos steps também seriam mantidos
+        print('{}: step released after {} s, conversations still pending: {}'.format(
+            self.latency.name, self.timeout, sorted(map(str, self.in_flight))))
+        self.latency.timeouts += 1
+        self.in_flight.clear()
+        self._release()
@@ -0,0 +1,247 @@
+"""Instrumentação dos simuladores mosaik e dos comportamentos do Pade.
+
+Contadores e histogramas de tempo são mantidos em memória por processo,
+com custo de uma chamada a perf_counter e uma busca binária por medida:
+
+- os StepLatency (flow_control) dos simuladores e das janelas dos
+  agentes registram cada step na família 'step';
+- funções decoradas com @timed registram cada chamada na família 'call';
+- o pool de otimizações (optimization) registra cada solução na
+  família 'optimization'.
+
+Eventos sem duração (ex.: acertos do cache do fluxo de carga) são
+contados por Counter, obtidos com counter(family, name).
+
+Os valores são exportados no formato texto do Prometheus, para um
+arquivo local (export) ou por um endpoint HTTP (serve).
+
+Mensagens de laços executados a cada step (ex.: a execução de um
+ShiftableLoad) passam por hot_log, que por padrão imprime a mensagem
+como antes; com a variável de ambiente INSTRUMENTATION_LOG_SAMPLE=N
+apenas uma a cada N mensagens de cada tipo é registrada, em nível DEBUG
+no logger 'instrumentation'.
+
+Variáveis de ambiente, lidas na importação do módulo:
+
+    INSTRUMENTATION=0               desativa as medições
+    INSTRUMENTATION_DIR=metrics     diretório dos arquivos exportados
+    INSTRUMENTATION_LOG_SAMPLE=100  amostragem das mensagens de hot_log
+
+======= Uso ================
+@timed('run_power_flow')
+def run_power_flow(grid, ...):
+    ...
+
+hot_log('shiftable_load', 'Load Executed: {:.2f} in {}', energy, demand)
+counter('power_flow_cache', 'hits').inc()
+
+export()            # INSTRUMENTATION_DIR/<script>-<pid>.prom
+serve(9100)         # http://localhost:9100/metrics
+"""
+
+import atexit
+import bisect
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = 'market_sim'
+
+# limites superiores das faixas dos histogramas, em segundos
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+enabled = os.environ.get('INSTRUMENTATION', '1') != '0'
+export_dir = os.environ.get('INSTRUMENTATION_DIR')
+log_sample = int(os.environ.get('INSTRUMENTATION_LOG_SAMPLE', '0')) or None
+
+logger = logging.getLogger('instrumentation')
+
+# histogramas deste processo: (família, nome) -> Histogram
+metrics = dict()
+# contadores deste processo: (família, nome) -> Counter
+counters = dict()
+_log_counts = dict()
+
+
+class Histogram(object):
+    '''Contagem, soma, máximo e distribuição por faixas das medidas
+    de tempo de um elemento.
+
+    :param family: família da métrica, ex.: 'step' ou 'call'
+    :param name: nome do elemento medido
+    '''
+    def __init__(self, family, name):
+        self.family = family
+        self.name = name
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, elapsed):
+        if not enabled:
+            return
+        self.count += 1
+        self.sum += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.buckets[bisect.bisect_left(BUCKETS, elapsed)] += 1
+
+
+def histogram(family, name):
+    '''Retorna o histograma (family, name), criado na primeira chamada.'''
+    key = (family, name)
+    h = metrics.get(key)
+    if h is None:
+        h = Histogram(family, name)
+        metrics[key] = h
+    return h
+
+
+class Counter(object):
+    '''Contagem de eventos de um elemento.
+
+    :param family: família da métrica, ex.: 'power_flow_cache'
+    :param name: nome do elemento contado
+    '''
+    def __init__(self, family, name):
+        self.family = family
+        self.name = name
+        self.value = 0
+
+    def inc(self, n=1):
+        if enabled:
+            self.value += n
+
+
+def counter(family, name):
+    '''Retorna o contador (family, name), criado na primeira chamada.'''
+    key = (family, name)
+    c = counters.get(key)
+    if c is None:
+        c = Counter(family, name)
+        counters[key] = c
+    return c
+
+
+def timed(name):
+    '''Decorador que registra o tempo de cada chamada da função no
+    histograma ('call', name). Com INSTRUMENTATION=0 a função não é
+    alterada.
+    '''
+    def decorator(function):
+        if not enabled:
+            return function
+        h = histogram('call', name)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                h.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def hot_log(key, message, *args):
+    '''Mensagem de um laço executado a cada step. Sem amostragem é
+    impressa como antes; com INSTRUMENTATION_LOG_SAMPLE=N somente a
+    primeira de cada N mensagens de key é registrada em nível DEBUG.
+    '''
+    if log_sample is None:
+        print(message.format(*args))
+        return
+    count = _log_counts.get(key, 0)
+    _log_counts[key] = count + 1
+    if count % log_sample == 0 and logger.isEnabledFor(logging.DEBUG):
+        logger.debug('[%s #%d] %s', key, count + 1, message.format(*args))
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render():
+    '''Histogramas e contadores no formato texto do Prometheus.'''
+    lines = list()
+    # cópia, pois o endpoint HTTP lê os histogramas em outra thread
+    items = sorted(metrics.copy().items())
+    for family in sorted({family for (family, _), h in items}):
+        metric = '{}_{}_seconds'.format(PREFIX, family)
+        lines.append('# TYPE {} histogram'.format(metric))
+        for (f, name), h in items:
+            if f != family:
+                continue
+            label = 'name="{}"'.format(_label(name))
+            cumulative = 0
+            for bound, n in zip(BUCKETS, h.buckets):
+                cumulative += n
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric, label, bound, cumulative))
+            lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(metric, label, h.count))
+            lines.append('{}_sum{{{}}} {}'.format(metric, label, h.sum))
+            lines.append('{}_count{{{}}} {}'.format(metric, label, h.count))
+        lines.append('# TYPE {}_max gauge'.format(metric))
+        for (f, name), h in items:
+            if f == family:
+                lines.append('{}_max{{name="{}"}} {}'.format(metric, _label(name), h.max))
+    items = sorted(counters.copy().items())
+    for family in sorted({family for (family, _), c in items}):
+        metric = '{}_{}_total'.format(PREFIX, family)
+        lines.append('# TYPE {} counter'.format(metric))
+        for (f, name), c in items:
+            if f == family:
+                lines.append('{}{{name="{}"}} {}'.format(metric, _label(name), c.value))
+    return '\n'.join(lines) + '\n'
+
+
+def export(path=None):
+    '''Grava os histogramas em path, por padrão em
+    INSTRUMENTATION_DIR/<script>-<pid>.prom. Sem path e sem
+    INSTRUMENTATION_DIR nada é gravado.
+    '''
+    if path is None:
+        if export_dir is None:
+            return None
+        script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]
+        os.makedirs(export_dir, exist_ok=True)
+        path = os.path.join(export_dir, '{}-{}.prom'.format(script, os.getpid()))
+    with open(path + '.tmp', 'w') as f:
+        f.write(render())
+    os.replace(path + '.tmp', path)
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host='localhost'):
+    '''Disponibiliza os histogramas em http://host:port/metrics,
+    em uma thread daemon. Retorna o servidor.
+    '''
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if export_dir is not None:
+    atexit.register(export)
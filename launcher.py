@@ -1,18 +1,68 @@
 import subprocess
 import shlex
-from time import sleep
+import socket
+import json
+import time
+
+from scenario import load_scenario
+
+
+def wait_for_port(host, port, timeout=60.0, interval=0.2):
+    '''Aguarda até que uma conexão TCP possa ser aberta em host:port,
+    ao invés de esperar um tempo fixo pelo runtime do Pade.
+
+    :param host: endereço do agente
+    :param port: porta do agente
+    :param timeout: tempo máximo de espera em segundos
+    :param interval: intervalo entre as tentativas em segundos
+    '''
+    deadline = time.time() + timeout
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=interval):
+                return
+        except OSError:
+            if time.time() > deadline:
+                raise TimeoutError('{}:{} not listening after {} s'.format(host, port, timeout))
+            time.sleep(interval)
+
+
+pade_config = json.load(open('pade_config.json'))
+
+# o último agente a ser criado é o utility agent, os prosumer
+# agents e o concentrator agent ocupam as portas anteriores
+last_port = pade_config['port'] + len(load_scenario('force.json', 'config.json').prosumers) + 1
+if pade_config.get('multiplex_prosumer_agents'):
+    # seguido do agente que hospeda o simulador dos prosumer agents
+    last_port += 1
 
 commands = 'pade start_runtime --config_file pade_config.json'
 commands = shlex.split(commands)
 p1 = subprocess.Popen(commands, stdin=subprocess.PIPE)
+p2 = None
 
-sleep(15.0)
-
-commands = 'python start_mosaik_sim.py'
-commands = shlex.split(commands)
-p2 = subprocess.Popen(commands, stdin=subprocess.PIPE)
+try:
+    wait_for_port('localhost', last_port)
 
-sleep(60.0)
+    start = time.time()
+    commands = 'python start_mosaik_sim.py'
+    commands = shlex.split(commands)
+    p2 = subprocess.Popen(commands, stdin=subprocess.PIPE)
 
-p1.terminate()
-p2.terminate()
+    # a simulação termina quando o mosaik conclui todos os steps,
+    # ou é interrompida após simulation_timeout segundos
+    p2.wait(timeout=pade_config.get('simulation_timeout'))
+    print('Simulation finished in {:.2f} s'.format(time.time() - start))
+except subprocess.TimeoutExpired:
+    print('Simulation not finished after {} s'.format(pade_config['simulation_timeout']))
+finally:
+    # o runtime do Pade e o mosaik não são deixados em execução,
+    # mesmo em caso de erro ou de KeyboardInterrupt
+    for p in (p2, p1):
+        if p is not None and p.poll() is None:
+            p.terminate()
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+                p.wait()
@@ -0,0 +1,191 @@
+"""Liquidação do mercado a partir das curvas preço x demanda dos agentes.
+
+Todas as curvas aceitas são empilhadas em uma matriz (propostas x pontos)
+e somadas em uma única operação. O preço de equilíbrio é o ponto em que
+a curva agregada cruza o zero, encontrado por interpolação linear entre
+os pontos da grade de preços das propostas. A quantidade de cada
+participante é o valor da sua curva no preço de equilíbrio.
+
+As propostas também podem ser somadas à medida que chegam (BidAggregator),
+de modo que no prazo final do leilão resta apenas a busca do cruzamento.
+Propostas enviadas pelos parâmetros das logísticas (encode_logistic) são
+avaliadas exatamente em uma grade mais fina dentro do intervalo que
+contém o cruzamento; reamostrar a curva agregada já linear por partes
+não tornaria o preço mais preciso.
+
+======= Uso ================
+result = clear_market(t, curves)
+result.price, result.quantities
+
+bids = BidAggregator(t)
+bids.add('device4', t, y, params)   # a cada proposta recebida
+result = bids.clear(points=501)
+"""
+
+import math
+
+import numpy as np
+
+from calc_methods import logistic_curves
+
+
+class ClearingResult(object):
+    '''Resultado da liquidação do mercado.
+
+    :param price: preço de equilíbrio, None se a curva agregada não
+    cruza o zero na faixa de preços
+    :param quantities: quantidade de cada proposta no preço de equilíbrio,
+    na ordem das linhas da matriz de curvas
+    :param t: grade de preços em que a curva agregada foi avaliada
+    :param aggregate: curva agregada na grade t
+    '''
+    def __init__(self, price, quantities, t, aggregate):
+        self.price = price
+        self.quantities = quantities
+        self.t = t
+        self.aggregate = aggregate
+
+    @property
+    def cleared(self):
+        return self.price is not None
+
+
+def find_crossing(t, y):
+    '''Primeiro ponto em que a curva y(t) cruza o zero, por interpolação
+    linear entre os pontos da grade, ou None se não houver cruzamento.
+    '''
+    zeros = np.flatnonzero(y == 0.0)
+    changes = np.flatnonzero(y[:-1] * y[1:] < 0.0)
+    if changes.size and (not zeros.size or changes[0] < zeros[0]):
+        i = changes[0]
+        return float(t[i] - y[i] * (t[i + 1] - t[i]) / (y[i + 1] - y[i]))
+    if zeros.size:
+        return float(t[zeros[0]])
+    return None
+
+
+def interpolate_curves(t, curves, price):
+    '''Valor de cada curva (linhas da matriz) no preço informado.'''
+    i = int(np.clip(np.searchsorted(t, price, side='right') - 1, 0, len(t) - 2))
+    w = (price - t[i]) / (t[i + 1] - t[i])
+    return curves[:, i] * (1.0 - w) + curves[:, i + 1] * w
+
+
+def refine_crossing(t, y, price, evaluate, points):
+    '''Refina o cruzamento price encontrado na grade t avaliando a curva
+    exata evaluate(precos) em pontos igualmente espaçados do intervalo
+    de t que o contém, com a resolução de uma grade de `points` pontos
+    em toda a faixa de preços.
+    '''
+    i = int(np.clip(np.searchsorted(t, price, side='right') - 1, 0, len(t) - 2))
+    if y[i] == 0.0:
+        return price
+    sub = int(math.ceil((points - 1) / float(len(t) - 1))) + 1
+    fine_t = np.linspace(t[i], t[i + 1], sub)
+    refined = find_crossing(fine_t, evaluate(fine_t))
+    return price if refined is None else refined
+
+
+def clear_market(t, curves):
+    '''Liquida o mercado com as curvas informadas.
+
+    :param t: grade de preços das propostas
+    :param curves: matriz (propostas x pontos de t) ou lista de curvas
+    '''
+    t = np.asarray(t, dtype=float)
+    curves = np.asarray(curves, dtype=float).reshape(-1, len(t))
+    if not len(curves):
+        return ClearingResult(None, None, t, np.zeros_like(t))
+    aggregate = curves.sum(axis=0)
+    return clear_aggregate(t, aggregate, curves)
+
+
+def clear_aggregate(t, aggregate, curves=None):
+    '''Liquida o mercado a partir da curva agregada já somada. Se as
+    curvas individuais forem informadas as quantidades de cada uma no
+    preço de equilíbrio também são calculadas.
+    '''
+    price = find_crossing(t, aggregate)
+    quantities = None
+    if price is not None and curves is not None and len(curves):
+        quantities = interpolate_curves(t, curves, price)
+    return ClearingResult(price, quantities, t, aggregate)
+
+
+class BidAggregator(object):
+    '''Soma incremental das curvas de um leilão. Cada proposta é somada à
+    curva agregada quando chega e guardada em uma matriz pré-alocada, usada
+    apenas para as quantidades de cada participante na liquidação.
+
+    :param t: grade de preços das propostas
+    :param capacity: quantidade inicial de linhas da matriz de curvas
+    '''
+    def __init__(self, t, capacity=64):
+        self.t = np.asarray(t, dtype=float)
+        self.curves = np.empty((capacity, len(self.t)))
+        self.reset()
+
+    def reset(self):
+        '''Descarta as propostas do leilão anterior.'''
+        self.aggregate = np.zeros(len(self.t))
+        self.accepted = list()
+        self.rejected = list()
+        # propostas paramétricas: linha da matriz de curvas e parâmetros
+        self.params = list()
+
+    def __len__(self):
+        return len(self.accepted)
+
+    def add(self, name, t, y, params=None):
+        '''Soma a curva (t, y) do participante name. Curvas em outra grade
+        de preços são rejeitadas. Retorna True se a curva foi aceita.
+
+        :param params: parâmetros (n x 4) das logísticas que formam y,
+        como retornados por curve_codec.decode_bid, None para curvas
+        conhecidas apenas nos pontos de t
+        '''
+        if not np.array_equal(self.t, t):
+            self.rejected.append(name)
+            return False
+
+        n = len(self.accepted)
+        if n == len(self.curves):
+            grown = np.empty((2 * n, len(self.t)))
+            grown[:n] = self.curves
+            self.curves = grown
+        self.curves[n] = y
+        self.aggregate += self.curves[n]
+        self.accepted.append(name)
+        if params is not None:
+            self.params.append((n, np.asarray(params, dtype=float).reshape(-1, 4)))
+        return True
+
+    def clear(self, points=None):
+        '''Liquida o mercado com as curvas recebidas até o momento.
+
+        :param points: resolução, em pontos em toda a faixa de preços,
+        com que o cruzamento é refinado a partir dos parâmetros das
+        propostas paramétricas; None utiliza apenas a grade t
+        '''
+        if not self.accepted:
+            return ClearingResult(None, None, self.t, self.aggregate.copy())
+        curves = self.curves[:len(self.accepted)]
+        result = clear_aggregate(self.t, self.aggregate, curves)
+        if not result.cleared or not self.params or points is None or points <= len(self.t):
+            return result
+
+        rows = np.array([n for n, p in self.params])
+        params = np.vstack([p for n, p in self.params])
+        owner = np.repeat(rows, [len(p) for n, p in self.params])
+        # curvas sem parâmetros (ex.: a reta da concessionária) são
+        # lineares entre os pontos de t e interpoladas
+        sampled = self.aggregate - curves[rows].sum(axis=0)
+
+        def evaluate(prices):
+            return np.interp(prices, self.t, sampled) + logistic_curves(prices, *params.T).sum(axis=0)
+
+        price = refine_crossing(self.t, self.aggregate, result.price, evaluate, points)
+        quantities = interpolate_curves(self.t, curves, price)
+        exact = logistic_curves(np.array([price]), *params.T)[:, 0]
+        quantities[rows] = np.bincount(owner, weights=exact, minlength=len(curves))[rows]
+        return ClearingResult(price, quantities, self.t, self.aggregate)
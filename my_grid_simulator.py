@@ -5,20 +5,48 @@
 """
 __author__ = """Lucas S Melo <lucassmelo@dee.ufc.br>"""
 
+import hashlib
+import importlib.metadata
+import io
 import json
+import multiprocessing
+import os
+import pickle
+import sys
+import time
 import numpy as np
 import random
+import scipy.sparse
+import scipy.sparse.linalg
 
  # mygrid imports
 from mygrid.grid import GridElements, ExternalGrid, Section, LoadNode
 from mygrid.grid import Conductor, Switch, TransformerModel, LineModel
+from mygrid.grid import Auto_TransformerModel
 from mygrid.util import p2r, r2p
 from mygrid.power_flow.backward_forward_sweep_3p import calc_power_flow
+from mygrid.power_flow.backward_forward_sweep_3p import _dist_grid_sweep
+from mygrid.power_flow.backward_forward_sweep_3p import _make_nodes_depth_dictionary
+from mygrid.power_flow.backward_forward_sweep_3p import _get_upstream_neighbor_node
+from mygrid.power_flow.backward_forward_sweep_3p import _search_section
 
-grid_data = dict()
+from device_history import DeviceHistory
+from result_store import ResultStore
+from instrumentation import timed
+
+# cache dos modelos já montados: hash do arquivo da rede -> modelo
+# serializado. Deve ser incrementado sempre que create_mygrid_model
+# for alterado, para invalidar os modelos gravados em disco
+MODEL_VERSION = 1
+MYGRID_VERSION = importlib.metadata.version('mygrid')
+models = dict()
 
 def create_mygrid_model(file):
     data = json.load(file)
+
+    # o MyGrid percorre os setores da rede e serializa o modelo de forma
+    # recursiva, a profundidade cresce com a quantidade de nós
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20 * len(data['nodes']) + 1000))
     
     vll_mt = p2r(13.8e3, 0.0)
     vll_bt = p2r(380.0, 0.0)
@@ -120,16 +148,58 @@ def create_mygrid_model(file):
     grid_elements.add_load_node(list(nodes.values()))
     grid_elements.add_section(list(sections.values()))
     grid_elements.create_grid()
-
-    # inicializa o dicionario que irá armazenar os dados das simulações
-    for i in nodes.keys():
-        grid_data[str(i)] = dict(voltage=[], power=[])
-    
-    for i in sections.keys():
-        grid_data[str(i)] = dict(current=[])
+    section_current_nodes(grid_elements)
 
     return grid_elements
 
+def load_mygrid_model(file, cache_dir='.grid_cache'):
+    '''Equivalente a create_mygrid_model, mas reaproveita o modelo já
+    montado para o mesmo conteúdo do arquivo da rede. Os modelos são
+    mantidos serializados em memória e, se cache_dir não for None, em
+    cache_dir/<hash>.pickle, de modo que execuções seguintes e a criação
+    de várias redes a partir do mesmo arquivo não refazem a montagem.
+    Cada chamada retorna uma cópia independente do modelo.
+    '''
+    content = file.read()
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    key = hashlib.sha256(content).hexdigest()
+    # os modelos serializados dependem das classes do mygrid instalado
+    key = '{}-v{}-mygrid{}-py{}{}'.format(key, MODEL_VERSION, MYGRID_VERSION,
+                                          *sys.version_info[:2])
+
+    blob = models.get(key)
+    path = os.path.join(cache_dir, key + '.pickle') if cache_dir else None
+    if blob is None and path is not None and os.path.exists(path):
+        with open(path, 'rb') as f:
+            blob = f.read()
+    if blob is None:
+        grid = create_mygrid_model(io.BytesIO(content))
+        blob = pickle.dumps(grid, protocol=pickle.HIGHEST_PROTOCOL)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            # arquivo temporário por processo, como em load_scenario
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp, path)
+    models[key] = blob
+
+    grid = pickle.loads(blob)
+    section_current_nodes(grid)
+    return grid
+
+def create_result_store(grid, path, chunk_size=7 * 96):
+    '''Cria o ResultStore que irá armazenar os dados das
+    simulações de fluxo de carga da rede grid no diretório path.
+    '''
+    names, _ = section_current_nodes(grid)
+    return ResultStore(path,
+                       {'voltage': list(grid.load_nodes),
+                        'power': list(grid.load_nodes),
+                        'current': names},
+                       chunk_size=chunk_size)
+
 def reset_inputs(grid):
     
     for i, j in grid.load_nodes.items():
@@ -151,26 +221,439 @@ def set_inputs(grid, inputs):
     # for name, node in grid.load_nodes.items():
     #     print((name,node.pp))
 
-def run_power_flow(grid):
+def input_index(grid):
+    '''Tabela nome do nó -> posição no vetor de potências de entrada.
+    Deve ser calculada uma única vez, após a criação do modelo da rede.
+    '''
+    return {name: i for i, name in enumerate(grid.load_nodes)}
+
+def apply_inputs(grid, powers, warm_start=False):
+    '''Aplica em uma única passagem pelos nós de carga o vetor de
+    potências de entrada, equivalente a reset_inputs seguido de set_inputs.
+
+    :param grid: modelo da rede criado por create_mygrid_model
+    :param powers: vetor de potências em kVA na ordem de input_index(grid),
+    nós com potência nula ficam sem carga
+    :param warm_start: mantém as tensões do último fluxo de carga como
+    estimativa inicial, ao invés de retornar à tensão nominal
+    '''
+    pf = 0.9 # power factor
+    p = np.round(powers * np.cos(np.arccos(pf)), 3) * 1e3
+    q = np.round(powers * np.sin(np.arcsin(pf)), 3) * 1e3
+    s = p + 1j * q
+    for node, s_ in zip(grid.load_nodes.values(), s):
+        node.pp = np.zeros((3, 1), dtype=complex)
+        if not warm_start:
+            node.config_voltage(voltage=node.voltage_nom)
+        node.ip = np.zeros((3, 1), dtype=complex)
+        if s_ != 0.0:
+            node.config_load(power=s_)
+
+def section_current_nodes(grid):
+    '''Retorna os nomes das seções e, na mesma ordem, o nó de cada seção
+    que está mais próximo da subestação na árvore RNP do alimentador,
+    cuja corrente é registrada como corrente da seção.
+    A busca na árvore é feita uma única vez após a criação do modelo
+    e refeita apenas quando o estado das chaves da rede é alterado.
+    O resultado fica guardado no próprio modelo (grid._section_nodes),
+    de modo que é liberado junto com ele.
+    '''
+    state = tuple(sw.state for sw in grid.switchs.values())
+    cached = getattr(grid, '_section_nodes', None)
+    if cached is None or cached[0] != state:
+        rnp = grid.dist_grids['F0'].load_nodes_tree.rnp_dict()
+        names = list()
+        nodes = list()
+        for name, section in grid.sections.items():
+            p1 = int(rnp[section.n1.name])
+            p2 = int(rnp[section.n2.name])
+
+            if p1 > p2:
+                node = section.n2
+            else:
+                node = section.n1
+            names.append(name)
+            nodes.append(node)
+        cached = grid._section_nodes = (state, names, nodes)
+    return cached[1], cached[2]
+
+def gather_phases(nodes, attr):
+    '''Empilha os vetores de fase (3 x 1) do atributo attr (vp, pp ou ip)
+    de cada nó em uma única matriz complexa (nós x 3).
+    '''
+    return np.hstack([getattr(node, attr) for node in nodes]).T
+
+def sweep_power_flow(dist_grid, max_iterations=100, converg_crt=0.001):
+    '''Laço principal da varredura direta/inversa de calc_power_flow,
+    partindo das tensões atuais dos nós, que retorna a quantidade de
+    iterações realizadas até a convergência.
+
+    O pós-processamento de calc_power_flow (auto transformadores e
+    barras PV) não é repetido aqui, alimentadores que possuam estes
+    elementos são resolvidos por calc_power_flow e None é retornado.
+    '''
+    for node in dist_grid.load_nodes.values():
+        if node.generation is not None:
+            calc_power_flow(dist_grid, max_iterations, converg_crt)
+            return None
+    for section in dist_grid.sections.values():
+        if isinstance(section.transformer, Auto_TransformerModel):
+            calc_power_flow(dist_grid, max_iterations, converg_crt)
+            return None
+
+    max_depth = np.max(dist_grid.load_nodes_tree.rnp.transpose()[:, 0].astype(int))
+    nodes_depth_dict = _make_nodes_depth_dictionary(dist_grid)
+
+    iterations = 0
+    converg = 1e6
+    while iterations <= max_iterations and converg > converg_crt:
+        iterations += 1
+        for node in dist_grid.load_nodes.values():
+            node._calc_currents()
+        converg = _dist_grid_sweep(dist_grid, max_depth, nodes_depth_dict)
+    return iterations
+
+@timed('run_power_flow')
+def run_power_flow(grid, store=None, time=None, angles=False):
+    '''Executa o fluxo de carga e retorna os módulos das tensões e
+    potências dos nós e das correntes das seções, arrays (elementos x 3),
+    e a quantidade de iterações da varredura (iterations).
+    Com angles=True também retorna os ângulos, em graus, das tensões e
+    correntes (voltage_angle e current_angle).
+    Se store for informado os valores são registrados no instante time.
+    '''
     f0 = grid.dist_grids['F0']
-    calc_power_flow(f0)
+    iterations = sweep_power_flow(f0)
+
+    nodes = grid.load_nodes.values()
+    _, section_nodes = section_current_nodes(grid)
+    vp = gather_phases(nodes, 'vp')
+    ip = gather_phases(section_nodes, 'ip')
+    result = dict(voltage=np.abs(vp),
+                  power=np.abs(gather_phases(nodes, 'pp')),
+                  current=np.abs(ip),
+                  iterations=iterations)
+    if angles:
+        result['voltage_angle'] = np.angle(vp, deg=True)
+        result['current_angle'] = np.angle(ip, deg=True)
+
+    if store is not None:
+        store.append(time, **result)
+
+    return result
+
+class LinearPowerFlow(object):
+    '''Fluxo de carga linearizado em torno do ponto de operação a vazio.
+
+    As cargas são representadas como correntes constantes, calculadas
+    com as tensões a vazio. Assim as tensões dos nós e as correntes das
+    seções são funções lineares do vetor de potências dos nós, e a matriz
+    que as relaciona é montada uma única vez a partir das matrizes ABCD
+    das seções. Cada passo é então resolvido com duas substituições em
+    sistemas esparsos triangulares por blocos, fatorados uma única vez,
+    sem iterações.
+
+    Somente cargas de potência constante ligadas em estrela e sem
+    geração distribuída do mygrid são suportadas.
 
-    for name, node in grid.load_nodes.items():
-        grid_data[name]['voltage'].append((abs(node.vp[0, 0]), abs(node.vp[1, 0]), abs(node.vp[2, 0])))
-        grid_data[name]['power'].append((abs(node.pp[0, 0]), abs(node.pp[1, 0]), abs(node.pp[2, 0])))
+    ======= Uso ================
+    linear = LinearPowerFlow(grid)
+    result = linear.solve(powers)
+    '''
+    def __init__(self, grid, pf=0.9):
+        f0 = grid.dist_grids['F0']
+        nodes = list(grid.load_nodes.values())
+        pos = {node.name: k for k, node in enumerate(nodes)}
+        n = len(nodes)
 
-    for name, section in grid.sections.items():
-        p1 = int(f0.load_nodes_tree.rnp_dict()[section.n1.name])
-        p2 = int(f0.load_nodes_tree.rnp_dict()[section.n2.name])
+        for node in nodes:
+            if node.type_connection != 'wye' or node.generation is not None \
+                    or tuple(node.zipmodel) != (1.0, 0.0, 0.0):
+                raise ValueError('Linear power flow supports only constant power '
+                                 'wye loads, node {} is not'.format(node.name))
 
-        if p1 > p2:
-            node = section.n2
+        # ponto de operação a vazio
+        apply_inputs(grid, np.zeros(n))
+        sweep_power_flow(f0)
+        v0 = gather_phases(nodes, 'vp').reshape(-1)
+        _, section_nodes = section_current_nodes(grid)
+        i0 = gather_phases(section_nodes, 'ip').reshape(-1)
+
+        # a varredura é representada por dois sistemas esparsos em blocos
+        # 3 x 3, montados a partir da árvore do alimentador:
+        # (I - D) J = I: varredura inversa, J é a corrente passante de cada
+        # nó em função das correntes de carga I, com os blocos d de cada
+        # seção na linha do nó a montante e na coluna do nó a jusante
+        # (I - A) dV = -B J: varredura direta, dV é a variação de tensão
+        # de cada nó, com os blocos A de cada seção na linha do nó a
+        # jusante e na coluna do nó a montante e B na diagonal
+        # As matrizes d e A dos transformadores não são a identidade, por
+        # isso os sistemas são fatorados (sem preenchimento, pois a matriz
+        # é a de uma árvore) ao invés de formar as matrizes de incidência
+        # caminho-nó, cujo número de elementos cresce com a profundidade
+        depth_dict = _make_nodes_depth_dictionary(f0)
+        max_depth = max(int(depth) for depth in depth_dict)
+        d_blocks = list()
+        a_blocks = list()
+        b_blocks = list()
+        for depth in range(1, max_depth + 1):
+            for node in depth_dict[str(depth)]:
+                k = pos[node.name]
+                up_node = _get_upstream_neighbor_node(node, f0)
+                section = _search_section(up_node, node, f0)
+                u = pos[up_node.name]
+                d_blocks.append((u, k, section.d))
+                a_blocks.append((k, u, section.A))
+                b_blocks.append((k, k, section.B))
+
+        eye = scipy.sparse.identity(3 * n, dtype=complex, format='csc')
+        self.backward = scipy.sparse.linalg.splu(eye - _block_matrix(d_blocks, n))
+        self.forward = scipy.sparse.linalg.splu(eye - _block_matrix(a_blocks, n))
+        self.impedance = _block_matrix(b_blocks, n).tocsr()
+
+        # corrente de carga por kVA de cada nó: conj(S) / conj(V0)
+        self.factor = (np.cos(np.arccos(pf)) + 1j * np.sin(np.arcsin(pf))) * 1e3 / 3.0
+        self.weights = scipy.sparse.csr_matrix(
+            (np.conj(self.factor) / np.conj(v0), (np.arange(3 * n), np.repeat(np.arange(n), 3))),
+            shape=(3 * n, n))
+
+        self.rows = np.array([3 * pos[node.name] + p for node in section_nodes for p in range(3)])
+        self.nodes = n
+        self.sections = len(section_nodes)
+
+        # estrutura da varredura, utilizada por run_batch_power_flow
+        self.pf = pf
+        self.v0 = v0
+        self.i0 = i0
+
+    def sweep(self, currents):
+        '''Variação das tensões dos nós e correntes passantes dos nós
+        (3n, ou 3n x passos) para as correntes de carga informadas.
+        '''
+        passing = self.backward.solve(currents)
+        return self.forward.solve(-self.impedance.dot(passing)), passing
+
+    def solve(self, powers):
+        '''Retorna os mesmos resultados de run_power_flow para o vetor de
+        potências em kVA na ordem de input_index(grid).
+        '''
+        dv, passing = self.sweep(self.weights.dot(powers).astype(complex))
+        v = (self.v0 + dv).reshape(self.nodes, 3)
+        i = (self.i0 + passing[self.rows]).reshape(self.sections, 3)
+        return dict(voltage=np.abs(v),
+                    power=np.repeat(np.abs(powers * self.factor)[:, None], 3, axis=1),
+                    current=np.abs(i),
+                    iterations=None)
+
+def linear_power_flow(grid, pf=0.9):
+    '''Retorna o LinearPowerFlow da rede, montado uma única vez e guardado
+    no próprio modelo (grid._linear_power_flow), como section_current_nodes.
+    É montado novamente quando o estado das chaves da rede, pf ou
+    MODEL_VERSION mudam.
+    '''
+    state = (MODEL_VERSION, pf, tuple(sw.state for sw in grid.switchs.values()))
+    cached = getattr(grid, '_linear_power_flow', None)
+    if cached is None or cached[0] != state:
+        cached = grid._linear_power_flow = (state, LinearPowerFlow(grid, pf))
+    return cached[1]
+
+def _block_matrix(blocks, n):
+    '''Matriz esparsa (3n x 3n, CSC) a partir dos blocos 3 x 3 (linha do
+    nó, coluna do nó, bloco).
+    '''
+    rows = list()
+    cols = list()
+    values = list()
+    p = np.repeat(np.arange(3), 3)
+    q = np.tile(np.arange(3), 3)
+    for r, c, block in blocks:
+        rows.append(3 * r + p)
+        cols.append(3 * c + q)
+        values.append(np.asarray(block, dtype=complex).reshape(-1))
+    if not blocks:
+        return scipy.sparse.csc_matrix((3 * n, 3 * n), dtype=complex)
+    return scipy.sparse.csc_matrix((np.concatenate(values),
+                                    (np.concatenate(rows), np.concatenate(cols))),
+                                   shape=(3 * n, 3 * n))
+
+def run_batch_power_flow(grid, powers, engine='sweep', angles=False,
+                         max_iterations=100, converg_crt=0.001, linear=None):
+    '''Resolve de uma só vez uma série de passos de tempo, dada a matriz de
+    potências em kVA (passos x nós, na ordem de input_index(grid)).
+
+    Com engine='sweep' a varredura direta/inversa é executada para todos
+    os passos ao mesmo tempo: a cada iteração as correntes de carga de
+    todos os passos são calculadas com as tensões atuais e as novas
+    tensões são obtidas com a varredura esparsa de LinearPowerFlow,
+    resolvida para todos os passos de uma vez. Passos já convergidos
+    continuam sendo atualizados até que todos convirjam. Com
+    engine='linear' o modelo linearizado é aplicado a todos os passos
+    de uma só vez.
+
+    Retorna os módulos das tensões e potências dos nós (passos x nós x 3)
+    e das correntes das seções (passos x seções x 3), e as iterações
+    necessárias para a convergência de cada passo. Com angles=True
+    também retorna voltage_angle e current_angle, em graus.
+
+    :param linear: LinearPowerFlow da rede, por padrão o retornado por
+    linear_power_flow(grid)
+    '''
+    if engine not in ('sweep', 'linear'):
+        raise ValueError('Unknown power flow engine: %s' % engine)
+    if linear is None:
+        linear = linear_power_flow(grid)
+    powers = np.atleast_2d(np.asarray(powers, dtype=float))
+    steps, n = powers.shape
+
+    if engine == 'linear':
+        dv, passing = linear.sweep(linear.weights.dot(powers.T).astype(complex))
+        vp = linear.v0 + dv.T
+        ip = linear.i0 + passing[linear.rows].T
+        iterations = np.zeros(steps, dtype=int)
+    else:
+        # potência por fase de cada nó, com o mesmo arredondamento de apply_inputs
+        pf = linear.pf
+        p = np.round(powers * np.cos(np.arccos(pf)), 3) * 1e3
+        q = np.round(powers * np.sin(np.arcsin(pf)), 3) * 1e3
+        s = np.repeat((p + 1j * q) / 3.0, 3, axis=1)
+
+        vp = np.tile(linear.v0, (steps, 1))
+        iterations = np.zeros(steps, dtype=int)
+        converged = np.zeros(steps, dtype=bool)
+        for i in range(1, max_iterations + 2):
+            current = np.conj(s / vp)
+            v_new = linear.v0 + linear.sweep(current.T)[0].T
+            # mesmo critério de convergência de mygrid: variação do
+            # módulo médio das tensões de fase de cada nó
+            conv = np.abs(np.abs(v_new).reshape(steps, n, 3).mean(axis=2) -
+                          np.abs(vp).reshape(steps, n, 3).mean(axis=2)).max(axis=1)
+            vp = v_new
+            iterations[~converged] = i
+            converged |= conv <= converg_crt
+            if converged.all():
+                break
+        ip = linear.i0 + linear.sweep(np.conj(s / vp).T)[1][linear.rows].T
+
+    vp = vp.reshape(steps, n, 3)
+    ip = ip.reshape(steps, linear.sections, 3)
+    result = dict(voltage=np.abs(vp),
+                  power=np.repeat(np.abs(powers * linear.factor)[:, :, None], 3, axis=2),
+                  current=np.abs(ip),
+                  iterations=iterations)
+    if angles:
+        result['voltage_angle'] = np.angle(vp, deg=True)
+        result['current_angle'] = np.angle(ip, deg=True)
+    return result
+
+def prosumer_power_matrix(grid, paths):
+    '''Monta a matriz de potências (passos x nós) para run_batch_power_flow
+    a partir dos históricos data/ProsumerSim0-0.Prosumer_<nó> gravados
+    pelos ProsumerAgent (diretórios lidos com DeviceHistory.load), somando
+    as potências de todos os dispositivos. Arquivos .json exportados por
+    DeviceHistory.to_json também são aceitos.
+    Retorna os instantes (ms desde 1970) e a matriz.
+    '''
+    index = input_index(grid)
+    series = dict()
+    for path in paths:
+        name = os.path.basename(os.path.normpath(path))
+        if os.path.isdir(path):
+            data = DeviceHistory.load(path)
+            times = DeviceHistory.timestamps(data).astype('datetime64[ms]').astype(np.int64)
+            values = sum(v for d, v in data.items() if d not in ('start', 'step'))
+            total = dict(zip(times.tolist(), np.broadcast_to(values, times.shape).tolist()))
+        else:
+            if name.endswith('.json'):
+                name = name[:-len('.json')]
+            data = json.load(open(path))
+            total = dict()
+            for device in data.values():
+                for t, value in device.items():
+                    total[int(t)] = total.get(int(t), 0.0) + (value or 0.0)
+        series[name.rsplit('_', 1)[1]] = total
+
+    times = sorted(set(t for total in series.values() for t in total))
+    position = {t: k for k, t in enumerate(times)}
+    powers = np.zeros((len(times), len(index)))
+    for node_name, total in series.items():
+        for t, value in total.items():
+            powers[position[t], index[node_name]] = value
+    return np.array(times), powers
+
+def compare_engines(grid, powers):
+    '''Resolve cada linha da matriz de potências (passos x nós) com a
+    varredura direta/inversa e com LinearPowerFlow, retornando os maiores
+    erros do modelo linear e o tempo médio por passo de cada método.
+    '''
+    linear = linear_power_flow(grid)
+    sweep_time = linear_time = 0.0
+    voltage_error = current_error = 0.0
+    for row in powers:
+        t0 = time.perf_counter()
+        apply_inputs(grid, row)
+        exact = run_power_flow(grid)
+        t1 = time.perf_counter()
+        approx = linear.solve(row)
+        t2 = time.perf_counter()
+        sweep_time += t1 - t0
+        linear_time += t2 - t1
+        voltage_error = max(voltage_error, np.max(np.abs(exact['voltage'] - approx['voltage'])
+                                                  / exact['voltage']))
+        current_error = max(current_error, np.max(np.abs(exact['current'] - approx['current'])))
+    return {'steps': len(powers),
+            'sweep_ms': sweep_time / len(powers) * 1e3,
+            'linear_ms': linear_time / len(powers) * 1e3,
+            'max_voltage_error_pu': voltage_error,
+            'max_current_error_a': current_error}
+
+def _grid_worker(conn, grid_json, warm_start, engine, cache_dir):
+    '''Laço do processo que mantém uma rede: recebe o vetor de potências
+    de cada passo e devolve os resultados do fluxo de carga.
+    '''
+    grid = load_mygrid_model(io.StringIO(grid_json), cache_dir)
+    linear = linear_power_flow(grid) if engine == 'linear' else None
+    while True:
+        powers = conn.recv()
+        if powers is None:
+            break
+        if linear is not None:
+            conn.send(linear.solve(powers))
         else:
-            node = section.n1
+            apply_inputs(grid, powers, warm_start)
+            conn.send(run_power_flow(grid))
+    conn.close()
+
+class GridProcess(object):
+    '''Rede elétrica mantida em um processo dedicado. Apenas o vetor de
+    potências de entrada (na ordem de input_index) e os arrays de
+    resultado de run_power_flow trafegam entre os processos.
+
+    ======= Uso ================
+    worker = GridProcess(open('force.json').read())
+    worker.submit(powers)
+    result = worker.result()
+    worker.close()
+    '''
+    def __init__(self, grid_json, warm_start=False, engine='sweep', cache_dir='.grid_cache'):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_grid_worker,
+                                               args=(child_conn, grid_json, warm_start,
+                                                     engine, cache_dir),
+                                               daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def submit(self, powers):
+        self.conn.send(powers)
 
-        grid_data[name]['current'].append((abs(node.ip[0, 0]), abs(node.ip[1, 0]), abs(node.ip[2, 0])))
+    def result(self):
+        return self.conn.recv()
 
-    return grid_data
+    def close(self):
+        if self.process.is_alive():
+            self.conn.send(None)
+            self.process.join()
+        self.conn.close()
 
 def main():
     grid = create_mygrid_model(open('force.json', 'r'))
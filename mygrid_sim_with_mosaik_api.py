@@ -5,8 +5,12 @@ and the mosaik interface to simulation
 import mosaik_api
 
 import my_grid_simulator
-import json
-from time import sleep
+import io
+import os
+import numpy as np
+from flow_control import StepLatency
+import instrumentation
+from result_store import ResultStore
 
 meta = {
     'models': {
@@ -17,7 +21,8 @@ meta = {
                 'gridfile'
             ],
             'attrs': [
-                'device_status', 'load_nodes'
+                'device_status', 'load_nodes', 'iterations',
+                'cache_hits', 'cache_misses'
             ],
         }
     }
@@ -34,14 +39,49 @@ class MyGrid(mosaik_api.Simulator):
         self.entities = {}
         self.relations = []  # List of pair-wise related entities (IDs)
         self.grids = []  # The MyGrid cases
-        self.cache = {}  # Cache for load flow outputs
-        self.grid_data = None
-
-    def init(self, sid, step_size, start, eid_prefix, debug=False):
+        self.indexes = []  # node name -> input vector position, per grid
+        self.eid_nodes = {}  # prosumer eid -> node name
+        self.cache = {}  # Cache for load flow outputs: grid -> (powers, result)
+        self.cache_hits = []  # Steps that reused the cached result, per grid
+        self.cache_misses = []  # Steps that solved the power flow, per grid
+        self.hits = instrumentation.counter('power_flow_cache', 'hits')
+        self.misses = instrumentation.counter('power_flow_cache', 'misses')
+        self.stores = []  # Power flow results, per grid
+        self.workers = []  # GridProcess per grid, when parallel
+        self.linear = []  # LinearPowerFlow per grid, when engine='linear'
+        self.iterations = []  # Sweep iterations of the last step, per grid
+        self.total_iterations = 0
+        self.power_flows = 0
+        self.export_json = False
+        self.latency = StepLatency('MyGrid')
+
+    def init(self, sid, step_size, start, eid_prefix, debug=False,
+             results_dir='grid_data', export_json=False, parallel=False,
+             warm_start=False, tolerance=None, engine='sweep',
+             model_cache='.grid_cache'):
+        # os resultados são gravados em results_dir/<eid> no formato .npz,
+        # export_json=True também gera o arquivo grid_data.json ao final
+        # parallel=True executa o fluxo de carga de cada rede em um processo
+        # warm_start=True parte das tensões do step anterior na varredura
+        # tolerance (kVA) reutiliza o último fluxo de carga calculado se
+        # nenhuma potência dos nós variou mais que tolerance
+        # engine='linear' usa o fluxo de carga linearizado (LinearPowerFlow)
+        # ao invés da varredura direta/inversa
+        # model_cache é o diretório dos modelos da rede já montados,
+        # None desativa o cache em disco
+        if engine not in ('sweep', 'linear'):
+            raise ValueError('Unknown power flow engine: %s' % engine)
         self.step_size = step_size
         self.start = start
         self.eid_prefix = eid_prefix
         self.debug = debug
+        self.results_dir = results_dir
+        self.export_json = export_json
+        self.parallel = parallel
+        self.warm_start = warm_start
+        self.tolerance = tolerance
+        self.engine = engine
+        self.model_cache = model_cache
         return self.meta
 
     def create(self, num, modelname, gridfile):
@@ -57,10 +97,26 @@ class MyGrid(mosaik_api.Simulator):
         # mas até aqui só teremos uma entitie para descrição 
         # de toda a rede 
 
+        grid_json = gridfile.read()
         for i in range(next_eid, next_eid + num):
             eid = '%s%d' % ('Grid_', i)
-            grid = my_grid_simulator.create_mygrid_model(gridfile)
+            grid = my_grid_simulator.load_mygrid_model(io.StringIO(grid_json),
+                                                       self.model_cache)
             self.grids.append(grid)
+            if self.parallel:
+                # no modo paralelo o fluxo de carga é calculado pela
+                # cópia da rede mantida no processo dedicado
+                self.workers.append(my_grid_simulator.GridProcess(grid_json, self.warm_start,
+                                                                  self.engine,
+                                                                  self.model_cache))
+            elif self.engine == 'linear':
+                self.linear.append(my_grid_simulator.linear_power_flow(grid))
+            self.iterations.append(None)
+            self.cache_hits.append(0)
+            self.cache_misses.append(0)
+            self.indexes.append(my_grid_simulator.input_index(grid))
+            self.stores.append(my_grid_simulator.create_result_store(
+                grid, os.path.join(self.results_dir, eid)))
             self.entities[eid] = i
             entities.append({'eid': eid, 'type': modelname})
 
@@ -79,44 +135,87 @@ class MyGrid(mosaik_api.Simulator):
         # return grids
 
     def step(self, time, inputs):
-        
+        self.latency.start()
+
         # acionado somente após uma semana de simulação
         if time >= (7* 24 * 60 * 60):
-            sleep(0.8)
 
-            for grid in self.grids:
-                my_grid_simulator.reset_inputs(grid)
-
-                # Este loop verifica os valores de entrada que
-                # provém das entities prosumers e utiliza estes
-                # dados para atualizar os valores de potencia
-                # demandada pelos nos correspondentes
+            # Os valores de entrada que provém das entities prosumers
+            # são acumulados em um único vetor de potências por rede,
+            # aplicado aos nós de carga em uma só passagem
 
+            vectors = list()
+            for grid, index in zip(self.grids, self.indexes):
+                powers = np.zeros(len(index))
                 for eid, attrs in inputs.items():
                     for attr, values in attrs.items():
-                        powers = dict()
-                        for eid_name, value in values.items():
-                            node_name = eid_name.split('.')[1]
-                            node_name = node_name.split('_')[1]
-                            
+                        for eid_name, device_status in values.items():
+                            node_name = self.node_name(eid_name)
+
                             # tratamento do dicionario device_status
                             # para obtenção do valor de potencia de cada
                             # um dos dispositivos do prosumer
-                            device_status = value
-                            power = 0.0
-                            for params in device_status.values():
-                                power += params['power']
-                            powers[node_name] = power
-
-                        my_grid_simulator.reset_inputs(grid)
-                        my_grid_simulator.set_inputs(grid, powers)
-                
-            for grid in self.grids:
-                self.grid_data = my_grid_simulator.run_power_flow(grid)
-                # print(self.grid_data)
- 
+                            powers[index[node_name]] = sum(
+                                params['power'] for params in device_status.values())
+
+                vectors.append(powers)
+
+            # somente as redes cujas potências variaram são recalculadas
+            changed = [i for i, powers in enumerate(vectors) if self.changed(i, powers)]
+            self.hits.inc(len(vectors) - len(changed))
+            self.misses.inc(len(changed))
+
+            if self.parallel:
+                # todos os processos calculam ao mesmo tempo e
+                # os resultados são coletados em seguida
+                for i in changed:
+                    self.workers[i].submit(vectors[i])
+                results = [self.workers[i].result() for i in changed]
+            elif self.engine == 'linear':
+                results = [self.linear[i].solve(vectors[i]) for i in changed]
+            else:
+                results = list()
+                for i in changed:
+                    my_grid_simulator.apply_inputs(self.grids[i], vectors[i], self.warm_start)
+                    results.append(my_grid_simulator.run_power_flow(self.grids[i]))
+
+            for i, result in zip(changed, results):
+                self.cache[i] = (vectors[i], result)
+                self.cache_misses[i] += 1
+                self.iterations[i] = result['iterations']
+                if result['iterations'] is not None:
+                    self.total_iterations += result['iterations']
+                    self.power_flows += 1
+
+            solved = set(changed)
+            for i, store in enumerate(self.stores):
+                if i not in solved:
+                    self.iterations[i] = 0
+                    self.cache_hits[i] += 1
+                store.append(time, **self.cache[i][1])
+
+        self.latency.stop()
         return time + self.step_size
         
+    def changed(self, i, powers):
+        '''Verifica se o vetor de potências da rede i difere do último
+        vetor resolvido em mais que a tolerância configurada.
+        '''
+        if self.tolerance is None or i not in self.cache:
+            return True
+        return np.max(np.abs(powers - self.cache[i][0]), initial=0.0) > self.tolerance
+
+    def node_name(self, eid_name):
+        '''Nome do nó da rede associado à entity prosumer,
+        ex.: ProsumerSim0-0.Prosumer_4 -> 4
+        '''
+        try:
+            return self.eid_nodes[eid_name]
+        except KeyError:
+            node_name = eid_name.split('.')[1].split('_')[1]
+            self.eid_nodes[eid_name] = node_name
+            return node_name
+
     def get_data(self, outputs):
         models = self.grids
         data = {}
@@ -126,11 +225,26 @@ class MyGrid(mosaik_api.Simulator):
             for attr in attrs:
                 if attr not in self.meta['models']['Grid']['attrs']:
                     raise ValueError('Unknown output attribute: %s' % attr)
-                data[eid][attr] = getattr(models[model_idx], attr)
+                if attr in ('iterations', 'cache_hits', 'cache_misses'):
+                    data[eid][attr] = getattr(self, attr)[model_idx]
+                else:
+                    data[eid][attr] = getattr(models[model_idx], attr)
         return data
 
     def finalize(self):
-        json.dump(self.grid_data, open('grid_data.json','w'))
+        for worker in self.workers:
+            worker.close()
+        for store in self.stores:
+            store.close()
+        if self.export_json:
+            for eid, i in self.entities.items():
+                name = 'grid_data.json' if i == 0 else 'grid_data_{}.json'.format(eid)
+                ResultStore.to_json(self.stores[i].path, name)
+        print(self.latency)
+        if self.power_flows:
+            print('MyGrid: {} power flows, mean {:.2f} sweep iterations'.format(
+                self.power_flows, self.total_iterations / self.power_flows))
+        instrumentation.export()
 
 def main():
     mosaik_api.start_simulation(MyGrid(), 'The mosaik-MyGrid adapter')
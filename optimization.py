@@ -0,0 +1,197 @@
+"""Serviço de otimização executado em um pool de processos dedicado.
+
+Os ProsumerAgent calculam o preço de contrato com a concessionária por
+meio de uma otimização bloqueante. Executá-la com defer_to_thread ocupa
+uma thread do pool padrão do reactor do Twisted por agente, o que com
+centenas de agentes esgota o pool usado também pelo Pade. Aqui as
+otimizações são executadas em um pool de processos de tamanho fixo:
+
+- requisições idênticas (mesma função e mesmos argumentos) em andamento
+  são executadas uma única vez e o resultado é entregue a todos;
+- cada requisição tem um tempo máximo, após o qual o deferred recebe
+  um OptimizationTimeout. Uma otimização que ainda está na fila é
+  retirada dela, mas uma que já está em execução não pode ser
+  interrompida: o processo continua ocupado até que ela termine e o
+  resultado é descartado (contadas em abandoned);
+- os resultados são entregues no thread do reactor por meio de deferreds;
+- a profundidade da fila e a latência das otimizações são registradas.
+
+As funções submetidas devem ser definidas no nível de um módulo e os
+argumentos serializáveis em JSON, utilizados para identificar
+requisições idênticas.
+
+Os processos são iniciados com o método 'spawn': o pool é criado com o
+reactor do Twisted já em execução, e com 'fork' os processos herdariam
+as threads do reactor e os sockets de todos os agentes, mantendo as
+portas ocupadas mesmo após uma falha do processo principal.
+
+======= Uso ================
+service = get_service(workers=4, timeout=60.0)
+d = service.submit(call_pyomo, prices)
+d.addCallback(self.optimal_value)
+"""
+
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from twisted.internet import defer, reactor
+
+from flow_control import StepLatency
+
+# serviços criados neste processo, compartilhados pelos agentes
+services = dict()
+
+
+class OptimizationTimeout(Exception):
+    pass
+
+
+class OptimizationService(object):
+    '''Pool de processos para as otimizações dos agentes.
+
+    :param workers: quantidade de processos, None utiliza os.cpu_count()
+    :param timeout: tempo máximo de cada otimização em segundos
+    :param name: nome utilizado nos relatórios
+    :param start_method: método de início dos processos do pool
+    '''
+    def __init__(self, workers=None, timeout=60.0, name='Optimization',
+                 start_method='spawn'):
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.name = name
+        self.start_method = start_method
+        self.pool = None
+        # requisição -> deferreds dos agentes aguardando o resultado
+        self.pending = dict()
+        # requisição -> future em andamento, de modo que o resultado de
+        # uma requisição encerrada por timeout não é entregue a uma nova
+        # requisição idêntica
+        self.futures = dict()
+        self.submitted = dict()
+        self.latency = StepLatency(name, family='optimization')
+        self.requests = 0
+        self.deduplicated = 0
+        self.timeouts = 0
+        # otimizações encerradas por timeout que ainda ocupam um processo
+        self.abandoned = 0
+        self.failures = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self):
+        '''quantidade de otimizações distintas em andamento ou na fila'''
+        return len(self.pending)
+
+    def submit(self, function, *args):
+        '''Submete function(*args) ao pool e retorna um Deferred disparado
+        no thread do reactor com o resultado.
+        '''
+        self.requests += 1
+        key = (function.__module__, function.__qualname__,
+               json.dumps(args, sort_keys=True))
+        d = defer.Deferred()
+        waiters = self.pending.get(key)
+        if waiters is not None:
+            self.deduplicated += 1
+            waiters.append(d)
+            return d
+
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method))
+        future = self.pool.submit(function, *args)
+        self.pending[key] = [d]
+        self.futures[key] = future
+        self.submitted[key] = time.perf_counter()
+        self.max_depth = max(self.max_depth, self.depth)
+
+        timer = reactor.callLater(self.timeout, self._timeout, key, future)
+        future.add_done_callback(
+            lambda f: reactor.callFromThread(self._done, key, f, timer))
+        return d
+
+    def _finish(self, key, solved=True):
+        elapsed = time.perf_counter() - self.submitted.pop(key)
+        if solved:
+            self.latency.record(elapsed)
+        del self.futures[key]
+        return self.pending.pop(key)
+
+    def _done(self, key, future, timer):
+        if self.futures.get(key) is not future:
+            # a otimização já foi encerrada por timeout e o processo
+            # volta a ficar disponível
+            if not future.cancelled():
+                self.abandoned -= 1
+            return
+        if timer.active():
+            timer.cancel()
+        waiters = self._finish(key)
+        error = future.exception()
+        if error is not None:
+            self.failures += 1
+        for d in waiters:
+            if error is not None:
+                d.errback(error)
+            else:
+                d.callback(future.result())
+
+    def _timeout(self, key, future):
+        if self.futures.get(key) is not future:
+            return
+        # se a otimização ainda não começou ela é retirada da fila,
+        # caso contrário ela continua ocupando um processo do pool
+        # e o resultado é descartado quando chegar
+        if not future.cancel():
+            self.abandoned += 1
+        self.timeouts += 1
+        waiters = self._finish(key, solved=False)
+        error = OptimizationTimeout('{} not finished after {} s'.format(key[1], self.timeout))
+        for d in waiters:
+            d.errback(error)
+
+    def summary(self):
+        return {'name': self.name,
+                'workers': self.workers,
+                'requests': self.requests,
+                'deduplicated': self.deduplicated,
+                'timeouts': self.timeouts,
+                'abandoned': self.abandoned,
+                'failures': self.failures,
+                'depth': self.depth,
+                'max_depth': self.max_depth,
+                'mean_ms': self.latency.mean * 1e3,
+                'max_ms': self.latency.max * 1e3}
+
+    def __str__(self):
+        return ('{}: {} requests ({} deduplicated, {} timeouts, {} abandoned, {} failures), '
+                'queue depth {} (max {}), solve mean {:.2f} ms, max {:.2f} ms').format(
+            self.name, self.requests, self.deduplicated, self.timeouts,
+            self.abandoned, self.failures, self.depth, self.max_depth,
+            self.latency.mean * 1e3, self.latency.max * 1e3)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+def get_service(workers=None, timeout=60.0, name='Optimization', start_method='spawn'):
+    '''Retorna o serviço de otimização name deste processo, criado na
+    primeira chamada com os parâmetros informados.
+    '''
+    service = services.get(name)
+    if service is None:
+        service = OptimizationService(workers, timeout, name, start_method)
+        services[name] = service
+        reactor.addSystemEventTrigger('before', 'shutdown', _shutdown, service)
+    return service
+
+
+def _shutdown(service):
+    print(service)
+    service.close()
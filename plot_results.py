@@ -1,25 +1,29 @@
-import json
 import matplotlib.pyplot as plt
+import numpy as np
+
+from device_history import DeviceHistory
 
 '''
 {
-    'stochastic_gen': {'0': 0.09, '1': 0.05, '2': 0.32, ....},
-    'shiftable_load': {'0': 0.09, '1': 0.05, '2': 0.32, ....},
-    'buffering_device': {'0': 0.09, '1': 0.05, '2': 0.32, ....},
-    'user_action_load': {'0': 0.09, '1': 0.05, '2': 0.32, ....},
+    'start': '25/01/2019 - 10:00:00',
+    'step': 900,
+    'stochastic_gen': array([0.09, 0.05, 0.32, ....]),
+    'shiftable_load': array([0.09, 0.05, 0.32, ....]),
+    'buffering_device': array([0.09, 0.05, 0.32, ....]),
+    'user_action_device': array([0.09, 0.05, 0.32, ....]),
 }
 '''
-data = json.load(open('data/ProsumerSim0-0.Prosumer_4.json'))
+data = DeviceHistory.load('data/ProsumerSim0-0.Prosumer_4')
+times = DeviceHistory.timestamps(data)
+devices = {i: j for i, j in data.items() if i not in ('start', 'step')}
 
 # plota a demanda de cada device separadamente
-for i, j in data.items():
-    plt.plot(j.values(), 'o-')
+for i, j in devices.items():
+    plt.plot(times, j, 'o-', label=i)
 
 # plota a demanda total do prosumer
+plt.plot(times, np.sum(list(devices.values()), axis=0), 'o-', label='total')
 
-for i, j in data.items():
-    
-plt.plot(j.values(), 'o-')
-
+plt.legend()
 plt.grid(True)
-plt.show()
\ No newline at end of file
+plt.show()
@@ -13,6 +13,8 @@ import json
 import enlopy as el
 import numpy as np
 
+from instrumentation import hot_log
+
 def generate_timeseries(start, time, step):
     '''
         start = string em formato datetime: dd/mm/YYYY - hh:mm:ss
@@ -29,100 +31,311 @@ def generate_timeseries(start, time, step):
     # res_pp = [i.strftime('%D - %T') for i in res]
     return res
 
-class ShiftableLoad(object):
+def _interp_weights(hours):
+    '''
+        Retorna o vetor de pesos w (24 posições) tal que
+        np.dot(load_curve, w) é igual à média de
+        np.interp(hours, np.arange(24), load_curve).
+    '''
+    hours = np.asarray(hours, dtype=float)
+    lower = np.minimum(np.floor(hours).astype(int), 23)
+    frac = np.where(lower < 23, hours - lower, 0.0)
+    upper = np.minimum(lower + 1, 23)
+    weights = np.zeros(24)
+    np.add.at(weights, lower, 1.0 - frac)
+    np.add.at(weights, upper, frac)
+    return weights / len(hours)
+
+
+# pesos compartilhados por todas as tabelas de perfil de carga
+# com o mesmo instante inicial e passo de tempo
+_profile_weights_cache = dict()
+
+
+def daily_profile_weights(start_offset, step_size):
+    '''
+        start_offset = segundos do dia no início da simulação
+        step_size = passo de tempo da simulação em segundos
+
+        Retorna as matrizes (24 x passos por dia) que reamostram uma
+        curva de carga diária de 24 pontos para a resolução do passo
+        de simulação: np.dot(load_curve, demand_weights)[k] é a
+        demanda do passo k do dia e np.dot(load_curve, forecast_weights)[k]
+        é a previsão calculada por UserLoad.forecast nesse passo.
+    '''
+    key = (start_offset % (24 * 60 * 60), step_size)
+    if key in _profile_weights_cache:
+        return _profile_weights_cache[key]
+
+    if (24 * 60 * 60) % step_size != 0:
+        raise ValueError('step_size must divide a day: {}'.format(step_size))
+
+    steps_per_day = (24 * 60 * 60) // step_size
+    demand_weights = np.zeros((24, steps_per_day))
+    forecast_weights = np.zeros((24, steps_per_day))
+    for k in range(steps_per_day):
+        seconds = key[0] + k * step_size
+        demand_weights[:, k] = _interp_weights([_hour_of_day(seconds)])
+        forecast_seconds = seconds + 15 * 60 + 60 * np.arange(1, 16)
+        forecast_weights[:, k] = _interp_weights(np.round(_hour_of_day(forecast_seconds), 2))
+
+    _profile_weights_cache[key] = (demand_weights, forecast_weights)
+    return demand_weights, forecast_weights
+
+
+def _hour_of_day(seconds):
+    '''
+        Hora do dia com a resolução de minutos usada pelos
+        dispositivos (hour + minute / 60.0).
+    '''
+    return (seconds // (60 * 60)) % 24 + ((seconds // 60) % 60) / 60.0
+
+
+def _seconds_of_day(datetime):
+    return datetime.hour * 60 * 60 + datetime.minute * 60 + datetime.second
+
+
+DAY = 24 * 60 * 60 # seconds
+HOURS = np.arange(24)
+
+
+class TimeBase(object):
+    """Base de tempo inteira da simulação.
+
+    O tempo é representado em segundos desde start_datetime,
+    da mesma forma que o parâmetro time do método step do mosaik.
+    Com step_size informado, a hora do dia e o índice do dia de
+    cada passo de um dia de simulação são pré-calculados em tabelas,
+    de forma que nenhum objeto datetime ou timedelta é criado dentro
+    do laço de simulação. Instantes fora da grade de passos são
+    calculados aritmeticamente.
+
+    Objetos datetime só aparecem nas bordas: seconds() converte
+    um datetime recebido em segundos e to_datetime() faz o caminho
+    inverso para a geração de relatórios.
+    """
+    def __init__(self, start_datetime, step_size=None):
+        self.start_datetime = start_datetime
+        self.start_offset = _seconds_of_day(start_datetime)
+        self.step_size = step_size
+        self.steps_per_day = None
+
+        if step_size is not None and DAY % step_size == 0:
+            self.steps_per_day = DAY // step_size
+            seconds = self.start_offset + np.arange(self.steps_per_day) * step_size
+            # listas python: a indexação retorna int/float nativos
+            self.hour_table = ((seconds // (60 * 60)) % 24).tolist()
+            self.hour_of_day_table = _hour_of_day(seconds).tolist()
+            self.day_table = (seconds // DAY).tolist()
+
+    def seconds(self, datetime):
+        '''
+            Converte datetime em segundos desde o início da
+            simulação. Valores inteiros são retornados sem alteração.
+        '''
+        if isinstance(datetime, dt.datetime):
+            delta = datetime - self.start_datetime
+            return delta.days * DAY + delta.seconds
+        return datetime
+
+    def to_datetime(self, time):
+        return self.start_datetime + dt.timedelta(0, time)
+
+    def step_index(self, time):
+        '''
+            Retorna (dia, passo do dia) do instante time ou None
+            se time não coincidir com um passo de simulação.
+        '''
+        if self.steps_per_day is None or time % self.step_size != 0:
+            return None
+        return divmod(time // self.step_size, self.steps_per_day)
+
+    def hour(self, time):
+        index = self.step_index(time)
+        if index is None:
+            return ((self.start_offset + time) // (60 * 60)) % 24
+        return self.hour_table[index[1]]
+
+    def hour_of_day(self, time):
+        '''
+            Hora do dia com resolução de minutos (hour + minute / 60.0).
+        '''
+        index = self.step_index(time)
+        if index is None:
+            return _hour_of_day(self.start_offset + time)
+        return self.hour_of_day_table[index[1]]
+
+    def day(self, time):
+        '''
+            Índice do dia de calendário de time, sendo 0 o dia
+            de start_datetime.
+        '''
+        index = self.step_index(time)
+        if index is None:
+            return (self.start_offset + time) // DAY
+        return index[0] + self.day_table[index[1]]
+
+
+class TimedDevice(object):
+    """Classe base dos dispositivos que guardam o instante
+    do último passo (self.time) em segundos na base de tempo
+    self.clock. O atributo datetime é derivado para relatórios.
+    """
+    @property
+    def datetime(self):
+        return self.clock.to_datetime(self.time)
+
+
+def _duration_seconds(time_delta):
+    if isinstance(time_delta, dt.timedelta):
+        return time_delta.days * DAY + time_delta.seconds
+    return time_delta
+
+
+class ShiftableLoad(TimedDevice):
 
     OFF = 0
     ON = 1
 
-    def __init__(self, datetime, start_datetime, demand, time_delta):
+    def __init__(self, datetime, start_datetime, demand, time_delta, clock=None):
         '''
-            datetime = string em formato datetime: dd/mm/YYYY - hh:mm:ss
-            start_time = string em formato datetime: dd/mm/YYYY - hh:mm:ss
+            datetime = instante inicial (datetime ou segundos na base de tempo clock)
+            start_datetime = instante de início da carga (datetime ou segundos)
             demand = valor de demanda da carga em kva
-            time_in_hours = time delta de tempo de execução da carga
+            time_delta = tempo de execução da carga (timedelta ou segundos)
+            clock = TimeBase compartilhada; se None é criada a partir de datetime
 
             ======= Script de Testes ================
             datetimes = generate_timeseries('24/09/2018 - 00:00:00', 72*60*60, 5)
-            sl1 = ShiftableLoad('24/09/2018 - 00:00:00', '24/09/2018 - 10:00:00', 2.0, dt.timedelta(hours=0.5))
+            sl1 = ShiftableLoad(datetimes[0], datetimes[0] + dt.timedelta(hours=10), 2.0, dt.timedelta(hours=0.5))
             for datetime in datetimes:
-                sl1.step(datetime)
+                sl1.step(datetime, {})
         '''
-        self.datetime = datetime
-        self.start_datetime = start_datetime
-        self.demand = demand
-        self.time_delta = time_delta
+        self.clock = clock if clock is not None else TimeBase(datetime)
+        self.time = self.clock.seconds(datetime)
+        self.start_time = self.clock.seconds(start_datetime)
+        self.rated_demand = demand
+        self.demand = 0.0
+        self.duration = _duration_seconds(time_delta)
         self.status = self.OFF
         self.executed_today = False
-        self.time_left_in_sec = self.time_delta.seconds
+        self.time_left_in_sec = self.duration
 
+    @property
+    def start_datetime(self):
+        return self.clock.to_datetime(self.start_time)
 
     def step(self, datetime, commands):
+        time = self.clock.seconds(datetime)
         demand = 0.0
         delta_in_hours = 0.0
 
         if self.status == self.OFF:
-            if datetime >= self.start_datetime and not self.executed_today:
+            if time >= self.start_time and not self.executed_today:
                 self.status = self.ON
             else:
-                if datetime.day == self.start_datetime.day and self.executed_today:
+                if self.clock.day(time) == self.clock.day(self.start_time) and self.executed_today:
                     self.executed_today = False
-                    self.time_left_in_sec = self.time_delta.seconds
+                    self.time_left_in_sec = self.duration
 
         if self.status == self.ON:
-            demand = self.demand
+            demand = self.rated_demand
 
-            self.delta = datetime - self.datetime
-            if self.delta.seconds <= self.time_left_in_sec:
-                self.time_left_in_sec -= self.delta.seconds
-                delta_in_hours = self.delta.seconds / (60.0 * 60.0)
+            delta = time - self.time
+            if delta <= self.time_left_in_sec:
+                self.time_left_in_sec -= delta
+                delta_in_hours = delta / (60.0 * 60.0)
             else:
                 delta_in_hours = self.time_left_in_sec / (60.0 * 60.0)
                 self.time_left_in_sec = 0
                 self.executed_today = True
-                self.start_datetime += dt.timedelta(hours=24)
+                self.start_time += DAY
                 self.status = self.OFF
-            
+
+        self.time = time
         self.demand = round(demand, 2)
         self.energy = round(self.demand * delta_in_hours, 2)
         # energy = self.demand * (exec_time / (60.0 * 60.0))
         
         if demand != 0.0:
-            print('Load Executed: {:.2f} in {}'.format(energy, demand))
+            hot_log('shiftable_load', 'Load Executed: {:.2f} in {}', self.energy, demand)
         
         return self.demand, 0.0
 
 
-class UserLoad(object):
+class UserLoad(TimedDevice):
     """Representa uma classe que a cada passo
     de tempo retorna a demanda média de energia 
     para um determinado período de tempo.
     """
-    def __init__(self, datetime, user_daily_energy):
+    def __init__(self, datetime, user_daily_energy, step_size=None, clock=None):
+        '''
+            step_size = passo de tempo da simulação em segundos. Quando
+            informado, a curva de carga diária é reamostrada uma única vez
+            para a resolução do passo, junto com a janela de previsão,
+            e step passa a consultar as tabelas pelo número do passo.
+        '''
 
         self.demand = 0.0
-        self.datetime = datetime
+        self.clock = clock if clock is not None else TimeBase(datetime)
+        self.time = self.clock.seconds(datetime)
+        self.step_size = step_size
 
         # definição da curva de carga do consumidor
         self.load_curve = el.gen_daily_stoch_el(user_daily_energy)
 
+        self.demand_table = None
+        self.forecast_table = None
+        if step_size is not None:
+            demand_weights, forecast_weights = daily_profile_weights(self.clock.start_offset,
+                                                                     step_size)
+            self.demand_table = np.dot(self.load_curve, demand_weights)
+            self.forecast_table = np.dot(self.load_curve, forecast_weights)
+
     def step(self, datetime, commands):
         '''
         '''
-        time_delta = datetime - self.datetime
-        delta_in_hours = time_delta.seconds / (60.0 * 60.0)
+        time = self.clock.seconds(datetime)
+        delta_in_hours = (time - self.time) / (60.0 * 60.0)
+
+        self.time = time
+
+        k = self._step_index(time)
+        if k is not None:
+            self.demand = self.demand_table[k]
+            self.demand_forecast = self.forecast_table[k]
+            self.energy_forecast = round(self.demand_forecast * 15.0 / 60.0, 2)
+            self.energy = round(self.demand * delta_in_hours, 2)
+            return self.demand, self.demand_forecast
 
-        self.datetime = datetime
-        self.demand = np.interp(datetime.hour + datetime.minute / 60.0,
-                                np.arange(24),
+        self.demand = np.interp(self.clock.hour_of_day(time),
+                                HOURS,
                                 self.load_curve)
         self.energy = round(self.demand * delta_in_hours, 2)
         
-        return self.demand, self.forecast(datetime)
+        return self.demand, self.forecast(time)
+
+    def _step_index(self, time):
+        '''
+            Posição nas tabelas de perfil de carga do instante time,
+            ou None se as tabelas não estiverem disponíveis ou o
+            instante não coincidir com um passo de simulação.
+        '''
+        if self.demand_table is None or time % self.step_size != 0:
+            return None
+        return (time // self.step_size) % len(self.demand_table)
 
     def forecast(self, datetime):
-        datetime_list = [datetime + dt.timedelta(0, 15.0 * 60.0 + i * 60.0) for i in range(1, 16)]
-        hours = [round(i.hour + i.minute / 60.0, 2) for i in datetime_list]
-        self.demand_forecast = np.mean(np.interp(hours, np.arange(24), self.load_curve))
+        time = self.clock.seconds(datetime)
+        k = self._step_index(time)
+        if k is not None:
+            self.demand_forecast = self.forecast_table[k]
+            self.energy_forecast = round(self.demand_forecast * 15.0 / 60.0, 2)
+            return self.demand_forecast
+
+        seconds = self.clock.start_offset + time + 15 * 60 + 60 * np.arange(1, 16)
+        hours = np.round(_hour_of_day(seconds), 2)
+        self.demand_forecast = np.mean(np.interp(hours, HOURS, self.load_curve))
         self.energy_forecast = round(self.demand_forecast * 15.0 / 60.0, 2)
         return self.demand_forecast
 
@@ -130,7 +343,7 @@ class UserLoad(object):
         return 'Load'
 
 
-class DieselGeneration(object):
+class DieselGeneration(TimedDevice):
     '''
         Descrição
         ----------
@@ -183,9 +396,11 @@ class DieselGeneration(object):
                  generator_electrical_power=0.0,
                  maintenance_cost_rate=0.0,
                  add_startup_maintenance_cost=0.0,
-                 add_startup_fuel_use=0.0):
+                 add_startup_fuel_use=0.0,
+                 clock=None):
 
-        self.datetime = datetime
+        self.clock = clock if clock is not None else TimeBase(datetime)
+        self.time = self.clock.seconds(datetime)
         self.on_off = False
         self.fuel_price = fuel_price # in US$/m3
         self.generator_fuel_rate = generator_fuel_rate # in Wh/m3
@@ -208,9 +423,10 @@ class DieselGeneration(object):
 
     def step(self, datetime, commands):
 
+        time = self.clock.seconds(datetime)
         delta_in_hours = 0.0
-        self.delta = datetime - self.datetime
-        delta_in_hours = self.delta.seconds / (60.0 * 60.0)
+        self.delta = time - self.time
+        delta_in_hours = self.delta / (60.0 * 60.0)
         
         if commands.get('on_off') is not None:
             self.on_off = commands['on_off']
@@ -220,7 +436,7 @@ class DieselGeneration(object):
         # para o intervalo de 15min na próxima negociação
         # =================================================
         marg_cost = self.calc_marginal_cost(0.25, self.on_off)
-        self.datetime = datetime
+        self.time = time
         
 
         if self.on_off is True:
@@ -229,31 +445,34 @@ class DieselGeneration(object):
             return 0.0, marg_cost
 
 
-class PVGeneration(object):
+class PVGeneration(TimedDevice):
     """Representa uma classe que a cada passo
     de tempo retorna a produção média de energia 
     para um determinado período de tempo.
     """
-    def __init__(self, datetime, demand):
+    def __init__(self, datetime, demand, clock=None):
         self.demand = demand
-        self.datetime = datetime
+        self.clock = clock if clock is not None else TimeBase(datetime)
+        self.time = self.clock.seconds(datetime)
 
     def step(self, datetime, commands):
-        delta_de_tempo = datetime - self.datetime
-        delta_em_horas = delta_de_tempo.seconds / (60.0 * 60.0)
-        self.datetime = datetime
+        time = self.clock.seconds(datetime)
+        delta_em_horas = (time - self.time) / (60.0 * 60.0)
+        self.time = time
 
-        if datetime.hour >= 18 or datetime.hour < 6:
+        hour = self.clock.hour(time)
+        if hour >= 18 or hour < 6:
             self.demand = 0.0
         else:
             self.demand = round(uniform(0.2, 1.2), 3)
         
         self.energy = round(self.demand * delta_em_horas, 3)
         
-        return - self.demand, - self.forecast(datetime)
+        return - self.demand, - self.forecast(time)
 
     def forecast(self, datetime):
-        if datetime.hour >= 18 or datetime.hour < 7:
+        hour = self.clock.hour(self.clock.seconds(datetime))
+        if hour >= 18 or hour < 7:
             self.power_forecast = 0.0
         else:
             self.power_forecast = round(uniform(0.2, 1.2), 3)
@@ -266,7 +485,7 @@ class PVGeneration(object):
         return 'Generation'
 
 
-class Storage(object):
+class Storage(TimedDevice):
     """
     Descrição
     ---------
@@ -309,7 +528,8 @@ class Storage(object):
     def __init__(self,
                  datetime,
                  storage_electrical_power,
-                 storage_capacity):
+                 storage_capacity,
+                 clock=None):
         
         self.storage_capacity = storage_capacity# in wh
         self.storage_charge_qtd = 0.4 * storage_capacity # in wh
@@ -320,7 +540,8 @@ class Storage(object):
         self.price_history_vector = list()
         self.max_buy_price = None # in US$ 
         self.min_sell_price = None # in US$
-        self.datetime = datetime
+        self.clock = clock if clock is not None else TimeBase(datetime)
+        self.time = self.clock.seconds(datetime)
 
     def calc_min_sell_and_max_buy_prices(self):
         if len(self.price_history_vector) >= 20:
@@ -339,9 +560,9 @@ class Storage(object):
 
     def step(self, datetime, commands):
 
-        delta_de_tempo = datetime - self.datetime
-        delta_em_horas = delta_de_tempo.seconds / (60.0 * 60.0)
-        self.datetime = datetime
+        time = self.clock.seconds(datetime)
+        delta_em_horas = (time - self.time) / (60.0 * 60.0)
+        self.time = time
 
         prices = tuple([self.max_buy_price, self.min_sell_price])
 
@@ -364,8 +585,9 @@ class Storage(object):
                 else:
                     return 0.0, prices
 
-            elif commands['energy_price'] > self.max_buy_price and commands['energy_price'] < self.min_sell_price:
-                # bateria em estado de espera
+            elif commands['energy_price'] <= self.min_sell_price:
+                # bateria em estado de espera, inclusive quando o preço
+                # é igual a um dos limites (ex.: o primeiro preço recebido)
                 self.calc_min_sell_and_max_buy_prices()
                 self.storage_state = 'waiting'
                 return 0.0, prices
@@ -407,23 +629,25 @@ class Storage(object):
         return 'Storage'
 
 
-class BufferingDevice(object):
+class BufferingDevice(TimedDevice):
 
-    def __init__(self, datetime, demand):
-        self.datetime = datetime
+    def __init__(self, datetime, demand, clock=None):
+        self.clock = clock if clock is not None else TimeBase(datetime)
+        self.time = self.clock.seconds(datetime)
         self.demand = demand
 
     def step(self, datetime, commands):
+        self.time = self.clock.seconds(datetime)
         return 0.0, 0.0
 
 
-class Prosumer(object):
+class Prosumer(TimedDevice):
     """Esta classe implementa a lógica de consumo/produção
     de energia para cada passo de tempo de um prosumidor
     utilizando para isso instâncias das demais classes
     deste módulo, tais como Load, Generation e Storage
     """
-    def __init__(self, datetime, name, config):
+    def __init__(self, datetime, name, config, step_size=None, clock=None):
         '''
             config is a dictionary like this:
             {
@@ -446,8 +670,15 @@ class Prosumer(object):
                     'value': value
                 }
             }
+
+            step_size (opcional) habilita as tabelas de perfil de
+            carga pré-calculadas do UserLoad.
+
+            clock (opcional) é a TimeBase compartilhada pelos
+            dispositivos; datetime pode então ser dado em segundos.
         '''
-        self.datetime = datetime
+        self.clock = clock if clock is not None else TimeBase(datetime)
+        self.time = self.clock.seconds(datetime)
         self.name = name
         self.prosumer_id = int(name.split('_')[1])
         self.stochastic_gen = None
@@ -467,23 +698,26 @@ class Prosumer(object):
         self.device_status = dict()
         for device_name, device_values in config.items():
             if device_name == 'stochastic_gen':
-                self.stochastic_gen = PVGeneration(datetime=datetime,
-                                                   demand=device_values['value'])
+                self.stochastic_gen = PVGeneration(datetime=self.time,
+                                                   demand=device_values['value'],
+                                                   clock=self.clock)
                 self.device_status['stochastic_gen'] = {'status': 1,
                                                         'power': 0.0}
 
             elif device_name == 'shiftable_load':
-                start_datetime = datetime + dt.timedelta(hours=int(uniform(5, 22)))
-                self.shiftable_load = ShiftableLoad(datetime=datetime,
-                                                    start_datetime=start_datetime,
+                start_time = self.time + int(uniform(5, 22)) * 60 * 60
+                self.shiftable_load = ShiftableLoad(datetime=self.time,
+                                                    start_datetime=start_time,
                                                     demand=device_values['value'],
-                                                    time_delta=dt.timedelta(hours=0.5))
+                                                    time_delta=30 * 60,
+                                                    clock=self.clock)
                 self.device_status['shiftable_load'] = {'status': 0,
                                                         'power': 0.0}
 
             elif device_name == 'buffering_device':
-                self.buffering_device = BufferingDevice(datetime=datetime,
-                                                        demand=device_values['value'])
+                self.buffering_device = BufferingDevice(datetime=self.time,
+                                                        demand=device_values['value'],
+                                                        clock=self.clock)
                 self.device_status['buffering_device'] = {'status': 0,
                                                           'power': 0.0}
 
@@ -491,9 +725,10 @@ class Prosumer(object):
                 
                 storage_el_power = device_values['value']
                 
-                self.storage_device = Storage(datetime=datetime,
+                self.storage_device = Storage(datetime=self.time,
                                               storage_electrical_power=storage_el_power,
-                                              storage_capacity=30e3)
+                                              storage_capacity=30e3,
+                                              clock=self.clock)
                 self.device_status['storage_device'] = {'status': 0,
                                                         'power': 0.0}
 
@@ -501,19 +736,22 @@ class Prosumer(object):
 
                 gen_el_power = device_values['value']
                 
-                self.freely_control_gem = DieselGeneration(datetime=datetime,
+                self.freely_control_gem = DieselGeneration(datetime=self.time,
                                                            fuel_price=1.2*1e3,
                                                            generator_fuel_rate=2933e3,
                                                            generator_electrical_power=gen_el_power,
                                                            maintenance_cost_rate=0.5,
                                                            add_startup_maintenance_cost=0.1,
-                                                           add_startup_fuel_use=0.001)
+                                                           add_startup_fuel_use=0.001,
+                                                           clock=self.clock)
                 self.device_status['freely_control_gem'] = {'status': 0,
                                                             'power': 0.0}
 
             elif device_name == 'user_action_device':
-                self.user_action_device = UserLoad(datetime=datetime,
-                                                   user_daily_energy=device_values['value'])
+                self.user_action_device = UserLoad(datetime=self.time,
+                                                   user_daily_energy=device_values['value'],
+                                                   step_size=step_size,
+                                                   clock=self.clock)
                 self.device_status['user_action_device'] = {'status': 1,
                                                             'power': 0.0}
 
@@ -535,10 +773,10 @@ class Prosumer(object):
         }
         '''
 
-        delta_de_tempo = datetime - self.datetime
-        delta_em_horas = delta_de_tempo.seconds / (60.0 * 60.0)
+        time = self.clock.seconds(datetime)
+        delta_em_horas = (time - self.time) / (60.0 * 60.0)
 
-        self.datetime = datetime
+        self.time = time
         self.demand = 0.0
         self.forecast = 0.0
 
@@ -558,42 +796,42 @@ class Prosumer(object):
         commands = input_['commands']['ProsumerAgent_' + str(self.prosumer_id)]
         # ok
         if self.stochastic_gen is not None:
-            d, f = self.stochastic_gen.step(datetime, commands['stochastic_gen'])
+            d, f = self.stochastic_gen.step(time, commands['stochastic_gen'])
             self.device_status['stochastic_gen']['power'] = d
             self.device_status['stochastic_gen']['forecast'] = f
             # self.demand += d
             # self.forecast += f
         # ok
         if self.user_action_device is not None:
-            d, f = self.user_action_device.step(datetime, commands['user_action_device'])
+            d, f = self.user_action_device.step(time, commands['user_action_device'])
             self.device_status['user_action_device']['power'] = d
             self.device_status['user_action_device']['forecast'] = f
             # self.demand += d
             # self.forecast += f
         # the output it's the marginal cost and the power delivered
         if self.freely_control_gem is not None:
-            power, marginal_cost = self.freely_control_gem.step(datetime, commands['freely_control_gem'])
-            self.device_status['freely_control_gem']['power'] = d
+            power, marginal_cost = self.freely_control_gem.step(time, commands['freely_control_gem'])
+            self.device_status['freely_control_gem']['power'] = power
             self.device_status['freely_control_gem']['marginal_cost'] = marginal_cost
             # self.demand += d
             # self.forecast += f
         # informar autonomia
         if self.storage_device is not None:
-            power, prices = self.storage_device.step(datetime, commands['storage_device'])
-            self.device_status['storage_device']['power'] = d
+            power, prices = self.storage_device.step(time, commands['storage_device'])
+            self.device_status['storage_device']['power'] = power
             self.device_status['storage_device']['prices'] = prices
             # self.demand += d
             # self.forecast += f
         # informar ciclos de carga executados e pendentes
         if self.shiftable_load is not None:
-            d, f = self.shiftable_load.step(datetime, commands['shiftable_load'])
+            d, f = self.shiftable_load.step(time, commands['shiftable_load'])
             self.device_status['shiftable_load']['power'] = d
             self.device_status['shiftable_load']['forecast'] = f
             # self.demand += d
             # self.forecast += f
         # not defined
         if self.buffering_device is not None:
-            d, f = self.buffering_device.step(datetime, commands['buffering_device'])
+            d, f = self.buffering_device.step(time, commands['buffering_device'])
             self.device_status['buffering_device']['power'] = d
             self.device_status['buffering_device']['forecast'] = f
             # self.demand += d
@@ -612,20 +850,508 @@ class Prosumer(object):
         return 'Prosumer: {}'.format(self.name)
 
 
+class FleetProsumer(object):
+    """Visão de um prosumidor armazenado em um ProsumerFleet.
+
+    Expõe os mesmos atributos lidos pelo adaptador mosaik
+    (name e device_status), mas o estado dos dispositivos
+    fica nos arrays do fleet e o dicionário device_status
+    só é montado quando solicitado.
+    """
+    def __init__(self, fleet, index, name):
+        self.fleet = fleet
+        self.index = index
+        self.name = name
+        self.prosumer_id = int(name.split('_')[1])
+
+    @property
+    def device_status(self):
+        return self.fleet.device_status(self.index)
+
+    def __repr__(self):
+        return 'Prosumer: {}'.format(self.name)
+
+
+class ProsumerFleet(object):
+    """Motor colunar que reproduz o comportamento das classes
+    PVGeneration, UserLoad, ShiftableLoad, Storage, DieselGeneration
+    e BufferingDevice para toda a população de prosumidores.
+
+    O estado de cada tipo de dispositivo é armazenado em arrays
+    NumPy (uma posição por dispositivo) e todos os dispositivos
+    de um mesmo tipo avançam em uma única chamada vetorizada
+    por passo de tempo. O tempo é dado em segundos desde o
+    início da simulação, como no método step do mosaik.
+
+    ======= Script de Testes ================
+    fleet = ProsumerFleet(dt.datetime(2019, 1, 25, 10))
+    fleet.add_prosumers({'4': {'stochastic_gen': {'value': 5.41},
+                               'user_action_device': {'value': 5.55}}})
+    for t in range(0, 24 * 60 * 60, 5 * 60):
+        fleet.step(t, {'Prosumer_4': {'commands': {'ProsumerAgent_4': {}}}})
+    print(fleet.prosumers['Prosumer_4'].device_status)
+    """
+
+    # estado inicial (status) reportado por cada tipo de dispositivo,
+    # na mesma forma em que a classe Prosumer preenche device_status
+    DEVICE_STATUS = {'stochastic_gen': 1,
+                     'shiftable_load': 0,
+                     'buffering_device': 0,
+                     'storage_device': 0,
+                     'freely_control_gem': 0,
+                     'user_action_device': 1}
+
+    # códigos de estado da bateria
+    LOADING = 0
+    WAITING = 1
+    UNLOADING = 2
+
+    PRICE_HISTORY_SIZE = 50
+
+    def __init__(self, start_datetime, seed=None, step_size=None, load_tables=False, clock=None):
+        self.start_datetime = start_datetime
+        self.step_size = step_size
+        self.clock = clock if clock is not None else TimeBase(start_datetime, step_size)
+        self.start_offset = self.clock.start_offset
+        self.random = np.random.RandomState(seed)
+
+        self.prosumers = dict()
+        self.names = list()
+        self.devices = list()  # nomes dos dispositivos de cada prosumidor
+        self.time = np.zeros(0, dtype=int)
+        self.stepped = np.zeros(0, dtype=bool)
+
+        # para cada tipo de dispositivo: índice do prosumidor
+        # dono de cada linha e arrays com o estado do dispositivo
+        self.rows = {device: np.zeros(0, dtype=int) for device in self.DEVICE_STATUS}
+        self.row_of = {device: dict() for device in self.DEVICE_STATUS}
+
+        self.pv_power = np.zeros(0)
+        self.pv_forecast = np.zeros(0)
+
+        self.load_curves = np.zeros((0, 24))
+        self.load_demand_table = None
+        self.load_forecast_table = None
+        if load_tables:
+            self.load_weights = daily_profile_weights(self.start_offset, step_size)
+            steps_per_day = self.load_weights[0].shape[1]
+            self.load_demand_table = np.zeros((0, steps_per_day))
+            self.load_forecast_table = np.zeros((0, steps_per_day))
+        self.load_power = np.zeros(0)
+        self.load_forecast = np.zeros(0)
+
+        self.shift_rated_demand = np.zeros(0)
+        self.shift_start = np.zeros(0, dtype=int)
+        self.shift_duration = np.zeros(0, dtype=int)
+        self.shift_time_left = np.zeros(0, dtype=int)
+        self.shift_on = np.zeros(0, dtype=bool)
+        self.shift_executed = np.zeros(0, dtype=bool)
+        self.shift_power = np.zeros(0)
+
+        self.storage_el_power = np.zeros(0)
+        self.storage_capacity = np.zeros(0)
+        self.storage_charge = np.zeros(0)
+        self.storage_backup = np.zeros(0)
+        self.storage_state = np.zeros(0, dtype=int)
+        # histórico de preços de cada bateria, como a lista
+        # Storage.price_history_vector: os storage_prices_qtd preços
+        # mais recentes ocupam as primeiras posições da linha, do mais
+        # antigo para o mais recente, e as demais posições são NaN
+        self.storage_prices = np.zeros((0, self.PRICE_HISTORY_SIZE))
+        self.storage_prices_qtd = np.zeros(0, dtype=int)
+        self.storage_max_buy = np.zeros(0)
+        self.storage_min_sell = np.zeros(0)
+        self.storage_prices_out = np.zeros((0, 2))
+        self.storage_power = np.zeros(0)
+
+        self.gen_el_power = np.zeros(0)
+        self.gen_on_off = np.zeros(0, dtype=bool)
+        self.gen_marginal_cost = np.zeros(0)
+        self.gen_power = np.zeros(0)
+
+        # parâmetros do gerador diesel iguais aos usados na classe Prosumer
+        self.gen_fuel_price = 1.2 * 1e3
+        self.gen_fuel_rate = 2933e3
+        self.gen_maintenance_cost_rate = 0.5
+        self.gen_startup_maintenance_cost = 0.1
+        self.gen_startup_fuel_use = 0.001
+
+    def add_prosumers(self, configs):
+        '''
+            configs é um dicionário no mesmo formato recebido por
+            Simulator.add_prosumers: {node: {device_name: {'value': value}}}
+        '''
+        new = {device: list() for device in self.DEVICE_STATUS}
+        values = {device: list() for device in self.DEVICE_STATUS}
+
+        for node, config in configs.items():
+            index = len(self.names)
+            name = 'Prosumer_{}'.format(node)
+            self.names.append(name)
+            self.prosumers[name] = FleetProsumer(self, index, name)
+            self.devices.append([i for i in config if i in self.DEVICE_STATUS])
+            for device_name, device_values in config.items():
+                if device_name in self.DEVICE_STATUS:
+                    self.row_of[device_name][index] = len(self.rows[device_name]) + len(new[device_name])
+                    new[device_name].append(index)
+                    values[device_name].append(device_values['value'])
+
+        n = len(configs)
+        self.time = np.concatenate([self.time, np.zeros(n, dtype=int)])
+        self.stepped = np.concatenate([self.stepped, np.zeros(n, dtype=bool)])
+        for device in self.DEVICE_STATUS:
+            self.rows[device] = np.concatenate([self.rows[device],
+                                                np.array(new[device], dtype=int)])
+
+        self._add_pv(len(values['stochastic_gen']))
+        self._add_user_loads(values['user_action_device'])
+        self._add_shiftable_loads(values['shiftable_load'])
+        self._add_storages(values['storage_device'])
+        self._add_diesel_generators(values['freely_control_gem'])
+
+    def _add_pv(self, n):
+        self.pv_power = np.concatenate([self.pv_power, np.zeros(n)])
+        self.pv_forecast = np.concatenate([self.pv_forecast, np.zeros(n)])
+
+    def _add_user_loads(self, daily_energies):
+        n = len(daily_energies)
+        curves = np.array([el.gen_daily_stoch_el(i) for i in daily_energies]).reshape(n, 24)
+        self.load_curves = np.concatenate([self.load_curves, curves])
+        if self.load_demand_table is not None:
+            demand_weights, forecast_weights = self.load_weights
+            self.load_demand_table = np.concatenate([self.load_demand_table,
+                                                     np.dot(curves, demand_weights)])
+            self.load_forecast_table = np.concatenate([self.load_forecast_table,
+                                                       np.dot(curves, forecast_weights)])
+        self.load_power = np.concatenate([self.load_power, np.zeros(n)])
+        self.load_forecast = np.concatenate([self.load_forecast, np.zeros(n)])
+
+    def _add_shiftable_loads(self, demands):
+        n = len(demands)
+        # mesmo sorteio de horário de início usado na classe Prosumer
+        start = np.array([int(uniform(5, 22)) for i in range(n)], dtype=int) * 60 * 60
+        duration = np.full(n, 30 * 60, dtype=int)
+        self.shift_rated_demand = np.concatenate([self.shift_rated_demand, demands])
+        self.shift_start = np.concatenate([self.shift_start, start])
+        self.shift_duration = np.concatenate([self.shift_duration, duration])
+        self.shift_time_left = np.concatenate([self.shift_time_left, duration])
+        self.shift_on = np.concatenate([self.shift_on, np.zeros(n, dtype=bool)])
+        self.shift_executed = np.concatenate([self.shift_executed, np.zeros(n, dtype=bool)])
+        self.shift_power = np.concatenate([self.shift_power, np.zeros(n)])
+
+    def _add_storages(self, el_powers):
+        n = len(el_powers)
+        capacity = np.full(n, 30e3)
+        self.storage_el_power = np.concatenate([self.storage_el_power, el_powers])
+        self.storage_capacity = np.concatenate([self.storage_capacity, capacity])
+        self.storage_charge = np.concatenate([self.storage_charge, 0.4 * capacity])
+        self.storage_backup = np.concatenate([self.storage_backup, 0.2 * capacity])
+        self.storage_state = np.concatenate([self.storage_state,
+                                             np.full(n, self.LOADING, dtype=int)])
+        self.storage_prices = np.concatenate([self.storage_prices,
+                                              np.full((n, self.PRICE_HISTORY_SIZE), np.nan)])
+        self.storage_prices_qtd = np.concatenate([self.storage_prices_qtd, np.zeros(n, dtype=int)])
+        self.storage_max_buy = np.concatenate([self.storage_max_buy, np.full(n, np.nan)])
+        self.storage_min_sell = np.concatenate([self.storage_min_sell, np.full(n, np.nan)])
+        self.storage_prices_out = np.concatenate([self.storage_prices_out, np.full((n, 2), np.nan)])
+        self.storage_power = np.concatenate([self.storage_power, np.zeros(n)])
+
+    def _add_diesel_generators(self, el_powers):
+        n = len(el_powers)
+        self.gen_el_power = np.concatenate([self.gen_el_power, el_powers])
+        self.gen_on_off = np.concatenate([self.gen_on_off, np.zeros(n, dtype=bool)])
+        self.gen_marginal_cost = np.concatenate([self.gen_marginal_cost, np.zeros(n)])
+        self.gen_power = np.concatenate([self.gen_power, np.zeros(n)])
+
+    def step(self, time, inputs):
+        '''
+            inputs tem a mesma forma do dicionário recebido por
+            Simulator.step. Somente os prosumidores presentes em
+            inputs são avançados, como acontece com Prosumer.step.
+        '''
+        active = np.zeros(len(self.names), dtype=bool)
+        on_off = dict()
+        energy_price = dict()
+        for index, name in enumerate(self.names):
+            input_ = inputs.get(name)
+            if not input_:
+                continue
+            active[index] = True
+            commands = input_['commands'].get('ProsumerAgent_' + name.split('_')[1], {})
+            gen_commands = commands.get('freely_control_gem') or {}
+            if gen_commands.get('on_off') is not None:
+                on_off[index] = gen_commands['on_off']
+            storage_commands = commands.get('storage_device') or {}
+            if storage_commands.get('energy_price') is not None:
+                energy_price[index] = storage_commands['energy_price']
+
+        if not active.any():
+            return
+
+        seconds = self.start_offset + time
+        hour = self.clock.hour(time)
+        delta = time - self.time
+
+        self._step_pv(active, hour)
+        self._step_user_loads(active, time, seconds)
+        self._step_shiftable_loads(active, time, delta)
+        self._step_storages(active, delta, energy_price)
+        self._step_diesel_generators(active, on_off)
+
+        self.time[active] = time
+        self.stepped |= active
+
+    def _step_pv(self, active, hour):
+        rows = active[self.rows['stochastic_gen']]
+        n = rows.sum()
+        if hour >= 18 or hour < 6:
+            power = np.zeros(n)
+        else:
+            power = np.round(self.random.uniform(0.2, 1.2, n), 3)
+        if hour >= 18 or hour < 7:
+            forecast = np.zeros(n)
+        else:
+            forecast = np.round(self.random.uniform(0.2, 1.2, n), 3)
+        self.pv_power[rows] = - power
+        self.pv_forecast[rows] = - forecast
+
+    def _step_user_loads(self, active, time, seconds):
+        rows = active[self.rows['user_action_device']]
+
+        if self.load_demand_table is not None and time % self.step_size == 0:
+            k = (time // self.step_size) % self.load_demand_table.shape[1]
+            self.load_power[rows] = self.load_demand_table[rows, k]
+            self.load_forecast[rows] = self.load_forecast_table[rows, k]
+            return
+
+        hours = self.clock.hour_of_day(time)
+        # previsão: média dos 15 minutos seguintes a 15 min do passo atual
+        forecast_seconds = seconds + 15 * 60 + 60 * np.arange(1, 16)
+        forecast_hours = np.round(_hour_of_day(forecast_seconds), 2)
+
+        curves = self.load_curves[rows]
+        self.load_power[rows] = np.dot(curves, _interp_weights([hours]))
+        self.load_forecast[rows] = np.dot(curves, _interp_weights(forecast_hours))
+
+    def _step_shiftable_loads(self, active, time, delta):
+        rows = active[self.rows['shiftable_load']]
+        delta = delta[self.rows['shiftable_load']]
+        day = self.clock.day(time)
+        start_day = (self.start_offset + self.shift_start) // DAY
+
+        # =================================================
+        # cargas desligadas: liga as que chegaram ao horário
+        # de início e rearma as que já executaram no dia
+        # =================================================
+        off = rows & ~self.shift_on
+        turn_on = off & (time >= self.shift_start) & ~self.shift_executed
+        rearm = off & ~turn_on & (day == start_day) & self.shift_executed
+        self.shift_on |= turn_on
+        self.shift_executed[rearm] = False
+        self.shift_time_left[rearm] = self.shift_duration[rearm]
+
+        # =================================================
+        # cargas ligadas: consome o tempo restante e desliga
+        # as que terminaram o ciclo de execução
+        # =================================================
+        on = rows & self.shift_on
+        running = on & (delta <= self.shift_time_left)
+        finished = on & ~running
+        self.shift_time_left[running] -= delta[running]
+        self.shift_time_left[finished] = 0
+        self.shift_executed[finished] = True
+        self.shift_start[finished] += 24 * 60 * 60
+        self.shift_on[finished] = False
+
+        self.shift_power[rows] = np.where(on[rows],
+                                          np.round(self.shift_rated_demand[rows], 2),
+                                          0.0)
+
+    def _calc_min_sell_and_max_buy_prices(self, rows):
+        qtd = self.storage_prices_qtd[rows]
+        prices = self.storage_prices[rows]
+
+        full = qtd >= 20
+        sorted_ = np.sort(prices[full], axis=1)  # NaN vai para o final
+        full_qtd = qtd[full]
+        index = np.arange(len(full_qtd))
+        max_buy = np.empty(len(qtd))
+        min_sell = np.empty(len(qtd))
+        max_buy[full] = sorted_[index, 5]
+        min_sell[full] = sorted_[index, full_qtd - 6]
+
+        mean = np.nanmean(prices[~full], axis=1) if (~full).any() else np.zeros(0)
+        max_buy[~full] = mean
+        min_sell[~full] = 1.5 * mean
+
+        self.storage_max_buy[rows] = max_buy
+        self.storage_min_sell[rows] = min_sell
+
+    def _step_storages(self, active, delta, energy_price):
+        rows = active[self.rows['storage_device']]
+        delta_in_hours = delta[self.rows['storage_device']] / (60.0 * 60.0)
+        self.storage_prices_out[rows, 0] = self.storage_max_buy[rows]
+        self.storage_prices_out[rows, 1] = self.storage_min_sell[rows]
+
+        # =================================================
+        # atualiza o histórico de preços e os limites de
+        # compra e venda das baterias que receberam comando
+        # =================================================
+        price = np.full(len(rows), np.nan)
+        for index, value in energy_price.items():
+            row = self.row_of['storage_device'].get(index)
+            if row is not None:
+                price[row] = value
+        priced = rows & ~np.isnan(price)
+        if priced.any():
+            self.storage_prices[np.where(priced)[0], self.storage_prices_qtd[priced]] = price[priced]
+            self.storage_prices_qtd[priced] += 1
+            self._calc_min_sell_and_max_buy_prices(priced)
+            buy = priced & (price < self.storage_max_buy)
+            sell = priced & (price > self.storage_min_sell)
+
+            # como em Storage, o preço mais antigo é descartado quando o
+            # histórico completa PRICE_HISTORY_SIZE posições, após a
+            # decisão, e os limites são recalculados sem ele
+            full = priced & (self.storage_prices_qtd >= self.PRICE_HISTORY_SIZE)
+            if full.any():
+                self.storage_prices[full, :-1] = self.storage_prices[full, 1:]
+                self.storage_prices[full, -1] = np.nan
+                self.storage_prices_qtd[full] -= 1
+                self._calc_min_sell_and_max_buy_prices(full)
+
+            wait = priced & ~buy & ~sell
+            can_buy = self.storage_charge < self.storage_capacity
+            can_sell = self.storage_charge > self.storage_backup
+            self.storage_state[buy & can_buy] = self.LOADING
+            self.storage_state[wait] = self.WAITING
+            self.storage_state[sell & can_sell] = self.UNLOADING
+            charging = buy & can_buy
+            discharging = sell & can_sell
+        else:
+            charging = np.zeros(len(rows), dtype=bool)
+            discharging = np.zeros(len(rows), dtype=bool)
+
+        # =================================================
+        # baterias sem comando de preço continuam no estado
+        # definido anteriormente
+        # =================================================
+        unpriced = rows & ~priced
+        charging |= (unpriced & (self.storage_state == self.LOADING) &
+                     (self.storage_charge < self.storage_capacity))
+        discharging |= (unpriced & (self.storage_state == self.UNLOADING) &
+                        (self.storage_charge > self.storage_backup))
+
+        energy = self.storage_el_power * delta_in_hours
+        self.storage_charge[charging] += energy[charging]
+        self.storage_charge[discharging] -= energy[discharging]
+        self.storage_power[rows] = 0.0
+        self.storage_power[charging] = self.storage_el_power[charging]
+        self.storage_power[discharging] = - self.storage_el_power[discharging]
+
+    def _step_diesel_generators(self, active, on_off):
+        rows = active[self.rows['freely_control_gem']]
+        for index, value in on_off.items():
+            row = self.row_of['freely_control_gem'].get(index)
+            if row is not None:
+                self.gen_on_off[row] = value
+
+        # custo marginal para o intervalo de 15min da próxima negociação
+        marg_cost = self.gen_el_power * self.gen_fuel_price / self.gen_fuel_rate
+        marg_cost += self.gen_maintenance_cost_rate
+        marg_cost *= 0.25
+        marg_cost += np.where(self.gen_on_off,
+                              0.0,
+                              self.gen_startup_maintenance_cost +
+                              self.gen_startup_fuel_use * self.gen_fuel_price)
+
+        self.gen_marginal_cost[rows] = marg_cost[rows]
+        self.gen_power[rows] = np.where(self.gen_on_off[rows], self.gen_el_power[rows], 0.0)
+
+    def device_status(self, index):
+        '''
+            Monta o dicionário device_status do prosumidor index
+            com as mesmas chaves preenchidas pela classe Prosumer.
+        '''
+        stepped = self.stepped[index]
+        device_status = dict()
+        for device_name in self.devices[index]:
+            row = self.row_of[device_name][index]
+            status = {'status': self.DEVICE_STATUS[device_name], 'power': 0.0}
+            if device_name == 'stochastic_gen':
+                if stepped:
+                    status['power'] = float(self.pv_power[row])
+                    status['forecast'] = float(self.pv_forecast[row])
+            elif device_name == 'user_action_device':
+                if stepped:
+                    status['power'] = float(self.load_power[row])
+                    status['forecast'] = float(self.load_forecast[row])
+            elif device_name == 'freely_control_gem':
+                if stepped:
+                    status['power'] = float(self.gen_power[row])
+                    status['marginal_cost'] = float(self.gen_marginal_cost[row])
+            elif device_name == 'storage_device':
+                if stepped:
+                    status['power'] = float(self.storage_power[row])
+                    status['prices'] = tuple(None if np.isnan(i) else float(i)
+                                             for i in self.storage_prices_out[row])
+            elif device_name == 'shiftable_load':
+                if stepped:
+                    status['power'] = float(self.shift_power[row])
+                    status['forecast'] = 0.0
+            elif device_name == 'buffering_device':
+                if stepped:
+                    status['forecast'] = 0.0
+            device_status[device_name] = status
+        return device_status
+
+
 class Simulator(object):
     """Esta classe cria instâncias da classe
     Prosumer e faz a chamada de seu método step
     para cada passo de tempo de simulação.
+
+    O tempo de simulação é mantido em segundos desde
+    start_datetime por uma TimeBase compartilhada por todos
+    os dispositivos; step_size (em segundos) define a grade
+    de passos das tabelas de hora do dia.
+
+    Com engine='fleet' os prosumidores são simulados
+    em conjunto por um ProsumerFleet. Com load_tables=True
+    as cargas do usuário utilizam tabelas de perfil de carga
+    pré-calculadas na resolução de step_size.
     """
-    def __init__(self, start_datetime):
+    def __init__(self, start_datetime, engine='objects', step_size=None, load_tables=False):
+        if engine not in ('objects', 'fleet'):
+            raise ValueError('Unknown prosumer engine: {}'.format(engine))
+        if load_tables and step_size is None:
+            raise ValueError('load_tables requires step_size')
         self.prosumers = dict()
         self.data = list()
         self.start_datetime = dt.datetime.strptime(start_datetime, '%d/%m/%Y - %H:%M:%S')
+        self.engine = engine
+        self.step_size = step_size
+        self.load_tables = load_tables
+        self.clock = TimeBase(self.start_datetime, step_size)
+        self.fleet = None
+        if self.engine == 'fleet':
+            self.fleet = ProsumerFleet(self.start_datetime,
+                                       step_size=step_size,
+                                       load_tables=load_tables,
+                                       clock=self.clock)
 
     def add_prosumers(self, configs):
+        if self.fleet is not None:
+            self.fleet.add_prosumers(configs)
+            self.prosumers = self.fleet.prosumers
+            self.data.extend([] for i in configs)
+            return
+
         for node, config in configs.items():
             name = 'Prosumer_{}'.format(node)
-            prosumer = Prosumer(self.start_datetime, name, config)
+            prosumer = Prosumer(0, name, config,
+                                step_size=self.step_size if self.load_tables else None,
+                                clock=self.clock)
             self.prosumers[name] = prosumer
             self.data.append([])
 
@@ -655,19 +1381,28 @@ class Simulator(object):
         }
         '''
 
-        delta = dt.timedelta(0, time)
-        datetime = self.start_datetime + delta
+        if self.fleet is not None:
+            self.fleet.step(time, inputs)
+            return
+
         for prosumer_name, prosumer in self.prosumers.items():
-            prosumer.step(datetime, inputs.get(prosumer_name))
+            prosumer.step(time, inputs.get(prosumer_name))
             
             # ================================
             # PRIORIDADE PARA FIX!
             # ================================
 
-            # data = {'datetime': datetime.strftime('%D - %T'),
+            # data = {'datetime': self.datetime(time).strftime('%D - %T'),
             #         'demand': 0.0}
             # self.data[prosumer_name].append(data)
 
+    def datetime(self, time):
+        '''
+            Converte o tempo de simulação em segundos para
+            datetime, para uso em relatórios.
+        '''
+        return self.clock.to_datetime(time)
+
 
 def main():
 
@@ -3,7 +3,7 @@
 #
 # Criado por Lucas S Melo em 21 de julho de 2015 - Fortaleza, Ceará - Brasil
 
-from pade.misc.utility import display_message, call_in_thread, defer_to_thread
+from pade.misc.utility import display_message
 from pade.core.agent import Agent
 from pade.acl.aid import AID
 from pade.acl.messages import ACLMessage
@@ -12,12 +12,16 @@ from pade.behaviours.protocols import TimedBehaviour
 from pade.behaviours.protocols import FipaContractNetProtocol
 from pade.drivers.mosaik_driver import MosaikCon
 
-import pandas as pd
 import numpy as np
 import json
-import pickle
-from calc_methods import demand_curve
-from util import generate_timeseries
+import os
+from calc_methods import demand_curves
+from device_history import DeviceHistory
+from flow_control import StepWindow
+from scenario import load_scenario
+from curve_codec import encode_logistic
+from optimization import get_service
+import instrumentation
 import random
 
 MOSAIK_MODELS = {
@@ -36,21 +40,41 @@ class MosaikSim(MosaikCon):
     def __init__(self, agent):
         super(MosaikSim, self).__init__(MOSAIK_MODELS, agent)
         self.prosumer_sim_prefix = 'ProsumerSim0-0.Prosumer_'
-        self.prosumer_data = {'stochastic_gen': [],
-                              'freely_control_gen': [],
-                              'shiftable_load': [],
-                              'buffering_device': [],
-                              'user_action_device': [],
-                              'storage_device': []}
-
-    def init(self, sid, eid_prefix, prosumer_ref, start, step_size):
+        self.prosumer_data = None
+
+    def init(self, sid, eid_prefix, prosumer_ref, start, step_size, window=1):
         # self.sid = sid
+        # o step só é concluído enquanto houver menos de `window`
+        # conversas em andamento (leilão, compra de energia)
+        self.configure(eid_prefix, prosumer_ref, start, step_size,
+                       StepWindow(self, size=window,
+                                  name='{}{}'.format(eid_prefix, prosumer_ref)))
+        return MOSAIK_MODELS
+
+    def configure(self, eid_prefix, prosumer_ref, start, step_size, window):
+        '''Configura a entity do agente, também utilizado pelo
+        MultiplexMosaikSim, que compartilha sua janela de conversas
+        entre todos os agentes.
+        '''
         self.prosumer_ref = 'ProsumerSim0-0.Prosumer_{}'.format(prosumer_ref)
         self.eid_prefix = eid_prefix
         self.eid = '{}{}'.format(self.eid_prefix, prosumer_ref)
         self.start = start
         self.step_size = step_size
-        return MOSAIK_MODELS
+        self.window = window
+        # histórico dos dispositivos limitado à última semana, período
+        # de dados considerado pelo leilão, gravado em disco a cada dia
+        self.prosumer_data = DeviceHistory(capacity=7 * 24 * 60 * 60 // step_size,
+                                           ring=True,
+                                           path=os.path.join('data', self.prosumer_ref),
+                                           start=start,
+                                           step=step_size)
+
+    def begin(self, key):
+        self.window.begin((self.eid, key))
+
+    def end(self, key):
+        self.window.end((self.eid, key))
 
 
     def create(self, num, model):
@@ -62,6 +86,13 @@ class MosaikSim(MosaikCon):
         return entities
 
     def step(self, time, inputs):
+        self.window.step_started()
+        data = self.prosumer_step(time, inputs)
+        if data is not None:
+            yield self.set_data_async(data)
+        return self.window.step_finished(time)
+
+    def prosumer_step(self, time, inputs):
         '''
         {'ProsumerAgent_10': 
             {'device_status': 
@@ -77,6 +108,7 @@ class MosaikSim(MosaikCon):
             }
         }
         '''
+        data = None
 
         # lança comportamento que estabelece contrato com a concessionária 
         if time == 0 or time % (2 * 24 * 60 * 60) == 0:
@@ -94,6 +126,7 @@ class MosaikSim(MosaikCon):
             else:
                 self.req_energ_to_utility.message = message
                 self.req_energ_to_utility.on_start()
+            self.begin('utility')
             display_message(self.agent.aid.name,
                             'Query Prices Requested to utility.')
 
@@ -109,36 +142,7 @@ class MosaikSim(MosaikCon):
 
                 device_status = attrs.get('device_status', {})
                 for prosumer_eid, device_status_ in device_status.items():
-                    
-                    if device_status_.get('stochastic_gen'):
-                        self.prosumer_data['stochastic_gen'].append(device_status_['stochastic_gen']['power'])
-                    else:
-                        self.prosumer_data['stochastic_gen'].append(0.0)
-
-                    if device_status_.get('freely_control_gen'):
-                        self.prosumer_data['freely_control_gen'].append(device_status_['freely_control_gen']['power'])
-                    else:
-                        self.prosumer_data['freely_control_gen'].append(0.0)
-                    
-                    if device_status_.get('shiftable_load'):
-                        self.prosumer_data['shiftable_load'].append(device_status_['shiftable_load']['power'])
-                    else:
-                        self.prosumer_data['shiftable_load'].append(0.0)
-                    
-                    if device_status_.get('buffering_device'):
-                        self.prosumer_data['buffering_device'].append(device_status_['buffering_device']['power'])
-                    else:
-                        self.prosumer_data['buffering_device'].append(0.0)
-                    
-                    if device_status_.get('user_action_device'):
-                        self.prosumer_data['user_action_device'].append(device_status_['user_action_device']['power'])
-                    else:
-                        self.prosumer_data['user_action_device'].append(0.0)
-
-                    if device_status_.get('storage_device'):
-                        self.prosumer_data['storage_device'].append(device_status_['storage_device']['power'])
-                    else:
-                        self.prosumer_data['storage_device'].append(0.0)
+                    self.prosumer_data.append_status(device_status_)
 
             # =================================================
             # Definição dos comandos a serem enviados aos
@@ -155,7 +159,6 @@ class MosaikSim(MosaikCon):
             from_ = self.eid
             to_ = self.prosumer_ref
             data = {from_: {to_: {'commands': self.agent.device_dict}}}
-            yield self.set_data_async(data)
             
 
             # message = ACLMessage(ACLMessage.REQUEST)
@@ -176,14 +179,12 @@ class MosaikSim(MosaikCon):
         # armazena os dados da simulação
         if time % (1 * 24 * 60 * 60) == 0 and time != 0: # a cada dois dias
 
-            datetimes = generate_timeseries(start=self.start,
-                                            time=time,
-                                            step=15)
-            self.prosumer_data_df = pd.DataFrame(self.prosumer_data)
-            self.prosumer_data_df.index = datetimes
-            self.prosumer_data_df.to_json('data/{}.json'.format(self.prosumer_ref))
+            # apenas os passos do último dia são acrescentados ao arquivo
+            self.prosumer_data.flush()
             display_message(self.agent.aid.localname, 'data_recorded.')
-        return time + self.step_size
+
+        # comandos a serem enviados aos dispositivos via set_data
+        return data
 
     # def handle_get_data(self, data):
     #     print(data)
@@ -191,6 +192,11 @@ class MosaikSim(MosaikCon):
     def handle_set_data(self):
         pass
 
+    def stop(self):
+        self.prosumer_data.close()
+        display_message(self.agent.aid.localname, str(self.window.latency))
+        instrumentation.export()
+
     # def handle_get_progress(self, progress):
     #     print(progress)
 
@@ -205,6 +211,65 @@ class MosaikSim(MosaikCon):
         return data
 
 
+class MultiplexMosaikSim(MosaikCon):
+    '''Simulador mosaik único para todos os ProsumerAgent de um processo.
+
+    Cada agente é uma entity deste simulador e mantém o seu MosaikSim
+    apenas para guardar o seu estado. Um só socket é utilizado para a
+    comunicação com o mosaik e os comandos de todos os agentes são
+    enviados em uma única chamada set_data por step. O step é mantido
+    enquanto houver conversas em andamento em qualquer um dos agentes.
+    '''
+    def __init__(self, agent, prosumer_agents):
+        super(MultiplexMosaikSim, self).__init__(MOSAIK_MODELS, agent)
+        self.prosumer_agents = prosumer_agents
+        self.agents = dict()
+
+    def init(self, sid, eid_prefix, start, step_size, window=1):
+        self.eid_prefix = eid_prefix
+        self.start = start
+        self.step_size = step_size
+        self.window = StepWindow(self, size=window, name='ProsumerAgents')
+        for agent in self.prosumer_agents:
+            agent.mosaik_sim.configure(eid_prefix, agent.node_id, start,
+                                       step_size, self.window)
+            self.agents[agent.mosaik_sim.eid] = agent
+        return MOSAIK_MODELS
+
+    def create(self, num, model):
+        return [{'eid': eid, 'type': model} for eid in list(self.agents)[:num]]
+
+    def step(self, time, inputs):
+        self.window.step_started()
+        data = dict()
+        for eid, agent in self.agents.items():
+            agent_data = agent.mosaik_sim.prosumer_step(time, {eid: inputs.get(eid, {})})
+            if agent_data is not None:
+                data.update(agent_data)
+        if data:
+            yield self.set_data_async(data)
+        return self.window.step_finished(time)
+
+    def handle_set_data(self):
+        pass
+
+    def stop(self):
+        for agent in self.agents.values():
+            agent.mosaik_sim.prosumer_data.close()
+        display_message(self.agent.aid.localname, str(self.window.latency))
+        instrumentation.export()
+
+    def get_data(self, outputs):
+        data = {}
+        for eid, attrs in outputs.items():
+            data[eid] = {}
+            for attr in attrs:
+                if attr not in MOSAIK_MODELS['models']['ProsumerAgent']['attrs']:
+                    raise ValueError('Unknown output attribute: {}'.format(attr))
+                data[eid][attr] = getattr(self.agents[eid], 'device_dict')
+        return data
+
+
 class AuctionPropose(FipaContractNetProtocol):
     '''AuctionPropose
 
@@ -222,6 +287,7 @@ class AuctionPropose(FipaContractNetProtocol):
     def handle_cfp(self, message):
         """
         """
+        self.agent.mosaik_sim.begin('auction')
         self.agent.call_later(random.uniform(0.1, 0.2), self._handle_cfp, message)
 
     def _handle_cfp(self, message):
@@ -236,7 +302,7 @@ class AuctionPropose(FipaContractNetProtocol):
         # calcula a curva de preço vs. demanda
         # =================================================
         self.agent.calc_the_demand_curves()
-        content = pickle.dumps(self.agent.dm_curve)
+        content = encode_logistic(self.agent.dm_params)
         answer = self.message.create_reply()
         answer.set_performative(ACLMessage.PROPOSE)
         answer.set_content(content)
@@ -249,6 +315,7 @@ class AuctionPropose(FipaContractNetProtocol):
 
         display_message(self.agent.aid.name,
                         'REJECT_PROPOSAL message received')
+        self.agent.mosaik_sim.end('auction')
 
     def handle_accept_propose(self, message):
         """
@@ -263,6 +330,7 @@ class AuctionPropose(FipaContractNetProtocol):
         answer.set_performative(ACLMessage.INFORM)
         answer.set_content('OK')
         self.agent.send(answer)
+        self.agent.mosaik_sim.end('auction')
 
 
 class RequestEnergyToUtility(FipaRequestProtocol):
@@ -278,13 +346,17 @@ class RequestEnergyToUtility(FipaRequestProtocol):
         if content['type'] == 'ENERGY_BUYED':
             display_message(self.agent.aid.localname,
                             'Energy Buyed from utility: {:03.2f} kW'.format(content['qtd']))
+            self.agent.mosaik_sim.end('utility')
         elif content['type'] == 'PRICES':
             display_message(self.agent.aid.name,
                             'Prices received from utility {}'.format(content['prices']))
             
             # processo de otimizacao estocastica aqui
+            # executado no pool de processos compartilhado pelos agentes,
+            # requisições com os mesmos preços são resolvidas uma única vez
             utility_prices = content['prices']
-            defer_to_thread(call_pyomo, self.optimal_value)
+            d = get_service().submit(call_pyomo, utility_prices)
+            d.addCallbacks(self.optimal_value, self.optimization_failed)
 
             answer = message.create_reply()
             answer.set_performative(ACLMessage.REQUEST)
@@ -298,18 +370,21 @@ class RequestEnergyToUtility(FipaRequestProtocol):
     def optimal_value(self, value):
         display_message(self.agent.aid.name, 'Value: {}'.format(value)) 
 
+    def optimization_failed(self, failure):
+        display_message(self.agent.aid.name,
+                        'Optimization failed: {}'.format(failure.getErrorMessage()))
+
 class ProsumerAgent(Agent):
     def __init__(self, aid, node_id):
         super(ProsumerAgent, self).__init__(aid=aid, debug=False)
         self.node_id = node_id
         self.mosaik_sim = MosaikSim(self)
         self.dm_curve = np.zeros(50)
+        self.dm_params = np.zeros((0, 4))
         self.clear_price = None
 
-        # open the config.json file with some important informations about
-        # the device characteristics, read and store this information.
-        config = json.load(open('config.json'))
-
+        # the device characteristics are read from the scenario registry,
+        # parsed only once from the config.json file.
         '''This part of code create a dictionary like this:
 
             {'stochastic_gen': {'power': 5.41, 'status': None, 'demand': None},
@@ -318,12 +393,7 @@ class ProsumerAgent(Agent):
             'user_action_device': {'power': 5.55, 'status': None, 'demand': None}}
 
         '''
-        self.device_dict = dict()
-        for device_type, device_info in config['devices'].items():
-            if str(self.node_id) in device_info['powers'].keys():
-                self.device_dict[device_type] = {'power': device_info['powers'][str(self.node_id)],
-                                                 'status': None,
-                                                 'demand': None}
+        self.device_dict = load_scenario('force.json', 'config.json').device_dict(self.node_id)
         # print(self.aid.name)
         # print(self.device_dict)
 
@@ -338,48 +408,67 @@ class ProsumerAgent(Agent):
             'user_action_device': [...]}
         '''
 
+        # parâmetros (tm, ymax, ymin, k) de cada curva logística
+        params = list()
+
         # =================================================
         # lógica para formação da curva de demanda de 
         # carga livre do usuário 
         # =================================================
-        t, y1 = demand_curve(tm = random.uniform(0.5, 4.5),
-                             ymin= random.uniform(1.0, 2.0), 
-                             ymax= random.uniform(3.0, 5.0))
+        tm = random.uniform(0.5, 4.5)
+        ymin = random.uniform(1.0, 2.0)
+        ymax = random.uniform(3.0, 5.0)
+        params.append((tm, ymax, ymin, 6.0))
 
         # =================================================
         # lógica para formação da curva de demanda de 
         # geração intermitente
         # =================================================
-        t, y2 = demand_curve(tm = random.uniform(0.5, 4.5),
-                             ymin= - random.uniform(3.0, 5.0),
-                             ymax= - random.uniform(1.0, 2.0))
+        tm = random.uniform(0.5, 4.5)
+        ymin = - random.uniform(3.0, 5.0)
+        ymax = - random.uniform(1.0, 2.0)
+        params.append((tm, ymax, ymin, 6.0))
         # =================================================
         # lógica para formação da curva de demanda de 
         # geração controlável 
         # =================================================
-        t, y3 = demand_curve(tm = random.uniform(0.5, 4.5),
-                             ymin= - random.uniform(3.0, 5.0),
-                             ymax= - random.uniform(1.0, 2.0))
+        tm = random.uniform(0.5, 4.5)
+        ymin = - random.uniform(3.0, 5.0)
+        ymax = - random.uniform(1.0, 2.0)
+        params.append((tm, ymax, ymin, 6.0))
 
         # =================================================
         # lógica para formação da curva de demanda de 
         # dispositivo de armazenamento 
         # =================================================
-        t, y4 = demand_curve(tm = random.uniform(0.5, 4.5),
-                             ymin= random.uniform(1.0, 2.0),
-                             ymax= random.uniform(3.0, 5.0))
+        tm = random.uniform(0.5, 4.5)
+        ymin = random.uniform(1.0, 2.0)
+        ymax = random.uniform(3.0, 5.0)
+        params.append((tm, ymax, ymin, 6.0))
 
         # =================================================
         # lógica para formação da curva de demanda de 
         # carga controlável
         # =================================================
-        t, y5 = demand_curve(tm = random.uniform(0.5, 4.5),
-                             ymin= random.uniform(1.0, 2.0), 
-                             ymax= random.uniform(3.0, 5.0))
-
-        self.dm_curve = (t, y1 + y2 + y3 + y4 + y5)
-
-def call_pyomo():
+        tm = random.uniform(0.5, 4.5)
+        ymin = random.uniform(1.0, 2.0)
+        ymax = random.uniform(3.0, 5.0)
+        params.append((tm, ymax, ymin, 6.0))
+
+        # as cinco curvas são avaliadas em uma única operação, e a
+        # proposta enviada ao leilão carrega apenas seus parâmetros
+        self.dm_params = np.array(params)
+        t, y = demand_curves(*self.dm_params.T)
+        self.dm_curve = (t, y.sum(axis=0))
+
+class ProsumerHubAgent(Agent):
+    '''Agente que apenas hospeda o MultiplexMosaikSim dos ProsumerAgent
+    executados no mesmo processo.'''
+    def __init__(self, aid, prosumer_agents):
+        super(ProsumerHubAgent, self).__init__(aid=aid, debug=False)
+        self.mosaik_sim = MultiplexMosaikSim(self, prosumer_agents)
+
+def call_pyomo(prices=None):
     import time
     time.sleep(8.0)
     return random.uniform(0, 10)
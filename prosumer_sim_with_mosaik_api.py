@@ -1,6 +1,7 @@
 import mosaik_api
 import prosumer
-from time import sleep
+from flow_control import StepLatency
+import instrumentation
 
 META = {
     'models': {
@@ -19,9 +20,16 @@ class ProsumerSim(mosaik_api.Simulator):
         super().__init__(META)
         self.eid_prefix = 'Prosumer_'
         self.entities = {}
+        self.latency = StepLatency('ProsumerSim')
 
-    def init(self, sid, eid_prefix, start, step_size, debug=False):
-        self.simulator = prosumer.Simulator(start)
+    def init(self, sid, eid_prefix, start, step_size, debug=False, engine='objects',
+             load_tables=False):
+        # engine='fleet' simula todos os prosumidores de forma vetorizada
+        # load_tables=True pré-calcula os perfis de carga na resolução do step
+        self.simulator = prosumer.Simulator(start,
+                                            engine=engine,
+                                            step_size=step_size,
+                                            load_tables=load_tables)
         self.step_size = step_size
         self.debug = debug
         self.eid_prefix = eid_prefix
@@ -73,14 +81,7 @@ class ProsumerSim(mosaik_api.Simulator):
             ...
         }
         '''
-
-        # -----------------------
-        # inserido somente para não sobrecarregar os comportamentos
-        # do Pade. Quando a dinâmica dos devices ficar mais complexa
-        # deve ser retirado para não atrasar a simulação desnecessariamente
-        # -----------------------
-        if time >= (7 * 24 * 60 * 60): # só é acionado após uma semana de simulação
-            sleep(0.1)
+        self.latency.start()
 
         for eid_to, attrs in inputs.items():
             for attr, values in attrs.items():
@@ -95,6 +96,7 @@ class ProsumerSim(mosaik_api.Simulator):
                     # print(self.simulator.prosumers[eid_to])
                     # print('-------')
         self.simulator.step(time, inputs)
+        self.latency.stop()
         return time + self.step_size
 
     def get_data(self, outputs):
@@ -107,6 +109,10 @@ class ProsumerSim(mosaik_api.Simulator):
                 data[eid][attr] = getattr(self.simulator.prosumers[eid], attr)
         return data
 
+    def finalize(self):
+        print(self.latency)
+        instrumentation.export()
+
 
 def main():
     return mosaik_api.start_simulation(ProsumerSim())
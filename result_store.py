@@ -0,0 +1,115 @@
+"""Armazenamento colunar dos resultados das simulações de fluxo de carga.
+
+Os valores de cada passo de tempo são escritos em arrays NumPy
+pré-alocados com dimensões (steps x elementos x 3 fases), um por grandeza.
+Quando o bloco enche ele é gravado em disco como um arquivo .npz e o
+buffer é reaproveitado, de modo que a memória usada não cresce com
+a duração da simulação.
+
+======= Uso ================
+store = ResultStore('grid_data/Grid_0',
+                    {'voltage': node_names,
+                     'power': node_names,
+                     'current': section_names})
+store.append(time, voltage=v, power=p, current=i)
+store.close()
+
+data = ResultStore.load('grid_data/Grid_0')
+ResultStore.to_json('grid_data/Grid_0', 'grid_data.json')
+"""
+
+import os
+import glob
+import json
+import sys
+
+import numpy as np
+
+
+class ResultStore(object):
+    '''Resultados de uma rede gravados em blocos .npz.
+
+    :param path: diretório onde os blocos são gravados
+    :param elements: dicionário grandeza -> lista com os nomes dos
+    elementos (nós ou seções) associados à grandeza
+    :param chunk_size: quantidade de passos de tempo por bloco
+    :param phases: quantidade de fases de cada elemento
+    '''
+    def __init__(self, path, elements, chunk_size=7 * 96, phases=3):
+        self.path = path
+        self.elements = {q: [str(i) for i in names] for q, names in elements.items()}
+        self.chunk_size = chunk_size
+        self.phases = phases
+
+        self.times = np.empty(chunk_size, dtype=np.int64)
+        self.buffers = {q: np.empty((chunk_size, len(names), phases))
+                        for q, names in self.elements.items()}
+        self.row = 0
+        self.chunks = 0
+        self.steps = 0
+
+        os.makedirs(path, exist_ok=True)
+        for f in glob.glob(os.path.join(path, 'chunk_*.npz')):
+            os.remove(f)
+        json.dump({'elements': self.elements, 'phases': phases},
+                  open(os.path.join(path, 'meta.json'), 'w'))
+
+    def append(self, time, **values):
+        '''Registra os valores de um passo de tempo, cada grandeza
+        como um array (elementos x fases).
+        '''
+        self.times[self.row] = time
+        for q, buffer in self.buffers.items():
+            buffer[self.row] = values[q]
+        self.row += 1
+        self.steps += 1
+        if self.row == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.row == 0:
+            return
+        arrays = {q: buffer[:self.row] for q, buffer in self.buffers.items()}
+        np.savez(os.path.join(self.path, 'chunk_{:05d}.npz'.format(self.chunks)),
+                 time=self.times[:self.row], **arrays)
+        self.chunks += 1
+        self.row = 0
+
+    def close(self):
+        self.flush()
+
+    @staticmethod
+    def load(path):
+        '''Lê todos os blocos gravados em path e retorna um dicionário
+        grandeza -> array (steps x elementos x fases), com a chave
+        time para os instantes de cada passo e elements para os nomes.
+        '''
+        meta = json.load(open(os.path.join(path, 'meta.json')))
+        chunks = [np.load(f) for f in sorted(glob.glob(os.path.join(path, 'chunk_*.npz')))]
+        data = {'elements': meta['elements']}
+        for q in ['time'] + list(meta['elements']):
+            if chunks:
+                data[q] = np.concatenate([c[q] for c in chunks])
+            elif q == 'time':
+                data[q] = np.empty(0, dtype=np.int64)
+            else:
+                data[q] = np.empty((0, len(meta['elements'][q]), meta['phases']))
+        return data
+
+    @staticmethod
+    def to_json(path, file):
+        '''Exporta os resultados gravados em path para um arquivo JSON
+        no formato {elemento: {grandeza: [[fase a, fase b, fase c], ...]}}.
+        '''
+        data = ResultStore.load(path)
+        out = dict()
+        for q, names in data['elements'].items():
+            values = data[q]
+            for k, name in enumerate(names):
+                out.setdefault(name, dict())[q] = values[:, k, :].tolist()
+        json.dump(out, open(file, 'w'))
+
+
+if __name__ == '__main__':
+    # ex.: python result_store.py grid_data/Grid_0 grid_data.json
+    ResultStore.to_json(sys.argv[1], sys.argv[2])
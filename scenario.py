@@ -0,0 +1,106 @@
+"""Registro do cenário de simulação: force.json e config.json.
+
+Os arquivos da rede e dos dispositivos são interpretados uma única vez
+e os dados são organizados em estruturas indexadas pelo nó:
+nó -> dispositivos -> potências. O resultado é gravado em um snapshot
+(.scenario_cache/*.pickle), de modo que os demais processos (o runtime
+do Pade com todos os agentes e o mosaik) apenas carregam o snapshot, e
+dentro de um mesmo processo a criação de cada agente se torna uma
+consulta a um dicionário.
+
+======= Uso ================
+scenario = load_scenario()
+scenario.prosumers              # nós de baixa tensão da rede
+scenario.device_dict(node_id)   # dispositivos de um ProsumerAgent
+scenario.prosumer_configs()     # config_dict do ProsumerSim
+"""
+
+import hashlib
+import json
+import os
+import pickle
+
+# cenários já carregados neste processo
+scenarios = dict()
+
+
+class Scenario(object):
+    '''Dados do cenário indexados pelo nó.
+
+    :param grid_file: arquivo da rede (force.json)
+    :param config_file: arquivo dos dispositivos (config.json)
+    '''
+    def __init__(self, grid_file, config_file):
+        grid = json.load(open(grid_file, 'r'))
+        config = json.load(open(config_file, 'r'))
+
+        # nós da rede, somente os de baixa tensão possuem prosumidores
+        self.nodes = [i['name'] for i in grid['nodes']]
+        self.prosumers = [i['name'] for i in grid['nodes']
+                          if i['voltage_level'] == 'low voltage']
+
+        # nó -> {tipo do dispositivo: potência}, na ordem de config.json
+        self.devices = {str(i): dict() for i in config['nodes']}
+        for device_type, device_info in config['devices'].items():
+            for node, power in device_info['powers'].items():
+                self.devices.setdefault(node, dict())[device_type] = power
+
+        self.max_demand_kva = config.get('max_demand_kva')
+        self.config_nodes = [str(i) for i in config['nodes']]
+
+    def device_dict(self, node_id):
+        '''Dicionário de dispositivos de um ProsumerAgent, ex.:
+        {'stochastic_gen': {'power': 5.41, 'status': None, 'demand': None}, ...}
+        '''
+        return {device_type: {'power': power, 'status': None, 'demand': None}
+                for device_type, power in self.devices.get(str(node_id), {}).items()}
+
+    def prosumer_configs(self):
+        '''config_dict do ProsumerSim, ex.:
+        {'4': {'buffering_device': {'value': 2.1}, ...}, ...}
+        '''
+        return {node: {device_type: {'value': power}
+                       for device_type, power in self.devices[node].items()}
+                for node in self.config_nodes}
+
+
+def _stat(file):
+    st = os.stat(file)
+    return (os.path.abspath(file), st.st_mtime_ns, st.st_size)
+
+
+def load_scenario(grid_file='force.json', config_file='config.json',
+                  cache_dir='.scenario_cache'):
+    '''Retorna o Scenario dos arquivos informados. O cenário é mantido
+    em memória e no snapshot cache_dir/<hash>.pickle, que é refeito
+    somente quando algum dos arquivos é alterado. cache_dir=None
+    desativa o snapshot.
+    '''
+    stats = (_stat(grid_file), _stat(config_file))
+    scenario = scenarios.get(stats)
+    if scenario is not None:
+        return scenario
+
+    path = None
+    if cache_dir is not None:
+        key = hashlib.sha1(repr(stats[0][0] + stats[1][0]).encode('utf-8')).hexdigest()
+        path = os.path.join(cache_dir, key + '.pickle')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                cached_stats, scenario = pickle.load(f)
+            if cached_stats != stats:
+                scenario = None
+
+    if scenario is None:
+        scenario = Scenario(grid_file, config_file)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            # nome próprio do processo, pois o runtime do Pade e o mosaik
+            # podem gravar o mesmo arquivo ao mesmo tempo
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp, 'wb') as f:
+                pickle.dump((stats, scenario), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+
+    scenarios[stats] = scenario
+    return scenario
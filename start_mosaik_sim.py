@@ -2,6 +2,8 @@ import mosaik
 import json
 import random
 
+from scenario import load_scenario
+
 # ---------------------------------------
 # define inicio e tempo de execução
 # da simulação
@@ -14,15 +16,7 @@ END = int(QTD_HOURS * 60 * 60)
 
 def load_low_voltage_prosumers(file):
     # logica para criacao de prosumers somente na baixa tensao
-
-    data = json.load(open(file, 'r'))
-
-    prosumers_id = list()
-    for i in data['nodes']:
-        if i['voltage_level'] == 'low voltage':
-            prosumers_id.append(i['name'])
-
-    return prosumers_id
+    return list(load_scenario(grid_file=file).prosumers)
 
 
 def create_scenario(world, config_dict, prosumer_agent_sim_names):
@@ -55,13 +49,20 @@ def create_scenario(world, config_dict, prosumer_agent_sim_names):
     # comunicação com a plataforma PADE
     # =======================================
     prosumer_agent_sim_list = list()
-    for i, name in prosumer_agent_sim_names.items():
-        prosumer_agent_sim = world.start(name,
-                                       eid_prefix='ProsumerAgent_',
-                                       prosumer_ref=i,
-                                       start=START,
-                                       step_size=15 * 60) # o step de tempo é dado em segundos
-        prosumer_agent_sim_list.append(prosumer_agent_sim)
+    if isinstance(prosumer_agent_sim_names, str):
+        # um único simulador com todos os agentes como entities
+        prosumer_agent_hub = world.start(prosumer_agent_sim_names,
+                                         eid_prefix='ProsumerAgent_',
+                                         start=START,
+                                         step_size=15 * 60) # o step de tempo é dado em segundos
+    else:
+        for i, name in prosumer_agent_sim_names.items():
+            prosumer_agent_sim = world.start(name,
+                                           eid_prefix='ProsumerAgent_',
+                                           prosumer_ref=i,
+                                           start=START,
+                                           step_size=15 * 60) # o step de tempo é dado em segundos
+            prosumer_agent_sim_list.append(prosumer_agent_sim)
 
     # =======================================
     # inicializa a classe que representa o
@@ -92,7 +93,10 @@ def create_scenario(world, config_dict, prosumer_agent_sim_names):
     prosumers = prosumer_sim.Prosumer.create(len(config_dict),
                                              config_dict=config_dict)
 
-    prosumer_agents = [i.ProsumerAgent.create(1) for i in prosumer_agent_sim_list]
+    if isinstance(prosumer_agent_sim_names, str):
+        prosumer_agents = [[i] for i in prosumer_agent_hub.ProsumerAgent.create(len(config_dict))]
+    else:
+        prosumer_agents = [i.ProsumerAgent.create(1) for i in prosumer_agent_sim_list]
 
     concetrator_agent = concentrator_agent_sim.ConcentratorAgent.create(1)
 
@@ -125,12 +129,8 @@ if __name__ == '__main__':
     # Carrega o dicionário que contem as configurações
     # de cada um dos prosumidores da rede
     # =================================================
-    config_file = json.load(open('config.json'))
-    configs_list = list()
-    config_dict = {str(i): {} for i in config_file['nodes']}
-    for i, j in config_file['devices'].items():
-        for k, w in j['powers'].items():
-            config_dict[k][i] = {'value': w}
+    scenario = load_scenario('force.json', 'config.json')
+    config_dict = scenario.prosumer_configs()
 
     # =================================================
     # configura os simuladores conectados ao mosaik
@@ -144,8 +144,9 @@ if __name__ == '__main__':
 
     # -------------------------------------------------
     # configura os simuladores de device agents
-    prosumers_id = load_low_voltage_prosumers('force.json')
-    port = 1234
+    pade_config = json.load(open('pade_config.json'))
+    prosumers_id = scenario.prosumers
+    port = pade_config['port']
     prosumer_agent_sim_names = dict()
     for i in prosumers_id:
         name = 'ProsumerAgentSim{}'.format(i)
@@ -167,6 +168,16 @@ if __name__ == '__main__':
     # configura o simulador do utility agent
     sim_config['UtilityAgentSim0'] = {'connect': 'localhost:' + str(port)}
 
+    # -------------------------------------------------
+    # com multiplex_prosumer_agents os prosumer agents são
+    # atendidos por um único simulador, no lugar de um por agente
+    if pade_config.get('multiplex_prosumer_agents'):
+        port += 1
+        for name in prosumer_agent_sim_names.values():
+            del sim_config[name]
+        prosumer_agent_sim_names = 'ProsumerAgentSim'
+        sim_config[prosumer_agent_sim_names] = {'connect': 'localhost:' + str(port)}
+
     world = mosaik.World(sim_config)
     create_scenario(world, config_dict, prosumer_agent_sim_names)
 
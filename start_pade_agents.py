@@ -1,17 +1,23 @@
 from pade.acl.aid import AID
-from prosumer_agent import ProsumerAgent
+from prosumer_agent import ProsumerAgent, ProsumerHubAgent
 from concentrator_agent import ConcentratorAgent
 from utility_agent import UtilityAgent
 from pade.misc.utility import start_loop
 
-from start_mosaik_sim import load_low_voltage_prosumers
+from scenario import load_scenario
+from optimization import get_service
 
+import json
 import sys
     
 
 if __name__ == '__main__':
 
-    prosumers_id = load_low_voltage_prosumers('force.json')
+    pade_config = json.load(open('pade_config.json'))
+    prosumers_id = load_scenario('force.json', 'config.json').prosumers
+
+    # pool de processos compartilhado pelas otimizações dos prosumer agents
+    get_service(**pade_config.get('optimization', {}))
 
     agents = list()
     port = int(sys.argv[1]) 
@@ -30,4 +36,12 @@ if __name__ == '__main__':
     utility_agent = UtilityAgent(AID(name='utility@localhost:' + str(port)))
     agents.append(utility_agent)
 
+    # com multiplex_prosumer_agents um único simulador mosaik,
+    # hospedado pelo agente abaixo, atende todos os prosumer agents
+    if pade_config.get('multiplex_prosumer_agents'):
+        port += 1
+        hub_agent = ProsumerHubAgent(AID(name='prosumerhub@localhost:' + str(port)),
+                                     prosumer_agents=agents[:len(prosumers_id)])
+        agents.append(hub_agent)
+
     start_loop(agents)
@@ -0,0 +1,68 @@
+"""Equivalência entre os motores de simulação dos prosumidores.
+
+Simula as mesmas baterias com engine='objects' e engine='fleet',
+enviando os mesmos comandos de preço sorteados, e compara a cada
+passo a potência, o histórico de preços e a carga armazenada.
+"""
+
+import random
+
+import pytest
+
+from prosumer import Simulator
+
+START = '25/01/2019 - 10:00:00'
+STEP_SIZE = 15 * 60
+
+
+def storage_configs(rng, prosumers):
+    return {str(i): {'storage_device': {'value': rng.uniform(1.0e3, 5.0e3)}}
+            for i in range(prosumers)}
+
+
+def price_inputs(rng, configs, price_probability):
+    inputs = dict()
+    for node in configs:
+        command = dict()
+        if rng.random() < price_probability:
+            command['energy_price'] = round(rng.uniform(1.0, 3.0), 2)
+        inputs['Prosumer_' + node] = {
+            'commands': {'ProsumerAgent_' + node: {'storage_device': command}}}
+    return inputs
+
+
+def assert_prices_equal(objects, fleet):
+    assert len(objects) == len(fleet)
+    for a, b in zip(objects, fleet):
+        if a is None or b is None:
+            assert a is None and b is None
+        else:
+            assert a == pytest.approx(b, rel=0.0, abs=1e-9)
+
+
+@pytest.mark.parametrize('price_probability', [0.1, 0.5, 1.0])
+def test_storage_engines_match(price_probability, prosumers=10, days=7):
+    # a quantidade de passos deve ser bem maior que o histórico
+    # de 50 preços das baterias
+    rng = random.Random(0)
+    configs = storage_configs(rng, prosumers)
+    objects = Simulator(START, engine='objects', step_size=STEP_SIZE)
+    fleet = Simulator(START, engine='fleet', step_size=STEP_SIZE)
+    objects.add_prosumers(configs)
+    fleet.add_prosumers(configs)
+    rows = fleet.fleet.row_of['storage_device']
+
+    for k in range(1, days * 24 * 60 * 60 // STEP_SIZE + 1):
+        inputs = price_inputs(rng, configs, price_probability)
+        objects.step(k * STEP_SIZE, inputs)
+        fleet.step(k * STEP_SIZE, inputs)
+
+        for name in inputs:
+            a = objects.prosumers[name]
+            b = fleet.prosumers[name]
+            status_a = a.device_status['storage_device']
+            status_b = b.device_status['storage_device']
+            assert status_a['power'] == status_b['power'], (k, name)
+            assert_prices_equal(status_a['prices'], status_b['prices'])
+            assert a.storage_device.storage_charge_qtd == pytest.approx(
+                fleet.fleet.storage_charge[rows[b.index]], rel=1e-12)
@@ -15,8 +15,8 @@ from pade.drivers.mosaik_driver import MosaikCon
 import pandas as pd
 import numpy as np
 import json
-import pickle
 from calc_methods import utility_curve
+from curve_codec import encode_curve
 import random
 
 MOSAIK_MODELS = {
@@ -106,7 +106,7 @@ class AuctionPropose(FipaContractNetProtocol):
         # calcula a curva de preço vs. demanda
         # =================================================
         self.agent.calc_utility_curve()
-        content = pickle.dumps(self.agent.utility_curve)
+        content = encode_curve(*self.agent.utility_curve)
         answer = self.message.create_reply()
         answer.set_performative(ACLMessage.PROPOSE)
         answer.set_content(content)